@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+
+MANIFEST_FILE_NAME = ".hoi4_utility_build.json"
+
+# Increase when generated images change for the same inputs, so every existing output is treated as stale
+BUILD_VERSION = 1
+
+
+class BuildManifest:
+    def __init__(self, outputDir: str):
+        """
+        Loads the build manifest of an output directory, which maps each generated file to a hash of everything used
+        to generate it
+        :param outputDir: Output folder path (ending with a slash)
+        """
+        self.outputDir = outputDir
+        self.path = outputDir + MANIFEST_FILE_NAME
+        self.outputs = {}
+        self.fileHashes = {}
+        # Files hashed by this build, kept in the manifest even when no output records them as its source (frames)
+        self._hashedPaths = set()
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+            self.outputs = manifest.get("outputs", {})
+            self.fileHashes = manifest.get("fileHashes", {})
+        except (OSError, ValueError):
+            # A missing or corrupt manifest only means every output is rebuilt
+            pass
+
+    def fileHash(self, path: str):
+        """
+        Hashes the contents of a file, reusing the stored hash if the file's size and modification time are unchanged
+        :param path: Path to the file
+        :return: Hex digest of the file contents
+        """
+        key = os.path.abspath(path)
+        fileStat = os.stat(key)
+        self._hashedPaths.add(key)
+
+        cached = self.fileHashes.get(key)
+        if cached is not None and cached["size"] == fileStat.st_size and cached["mtime"] == fileStat.st_mtime_ns:
+            return cached["hash"]
+
+        digest = hashlib.sha256()
+        with open(key, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+
+        self.fileHashes[key] = {"size": fileStat.st_size, "mtime": fileStat.st_mtime_ns, "hash": digest.hexdigest()}
+        return self.fileHashes[key]["hash"]
+
+    def itemKey(self, sourcePaths: [str], parameters: dict):
+        """
+        Creates the key of a generated item from its source files and generation parameters
+        :param sourcePaths: Source image followed by any frame assets used to generate the item
+        :param parameters: Generation parameters (filter flag, prefix, template...)
+        :return: Hex digest identifying the item
+        """
+        content = [BUILD_VERSION, [self.fileHash(path) for path in sourcePaths], parameters]
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def isFresh(self, outputPaths: [str], key: str):
+        """
+        Checks if every output of an item exists and was generated from the same key
+        :param outputPaths: Paths of the item's outputs
+        :param key: Key of the item from itemKey
+        :return: True if the item does not need to be generated again, otherwise False
+        """
+        for outputPath in outputPaths:
+            entry = self.outputs.get(self.outputName(outputPath))
+            if entry is None or entry["key"] != key or not os.path.exists(outputPath):
+                return False
+        return True
+
+    def record(self, generator: str, sourcePath: str, outputPaths: [str], key: str, sourceDir: str = None):
+        """
+        Records the outputs of a generated item
+        :param generator: Name of the generator that created the outputs
+        :param sourcePath: Path of the source image of the item
+        :param outputPaths: Paths of the item's outputs
+        :param key: Key of the item from itemKey
+        :param sourceDir: Input folder the item was listed from, defaults to the folder containing the source
+        """
+        if sourceDir is None:
+            sourceDir = os.path.dirname(os.path.abspath(sourcePath))
+        for outputPath in outputPaths:
+            self.outputs[self.outputName(outputPath)] = {
+                "generator": generator,
+                "source": os.path.abspath(sourcePath),
+                "sourceDir": os.path.abspath(sourceDir),
+                "key": key,
+            }
+
+    def removeOrphans(self, generator: str, sourceDir: str, outputPaths: [str]):
+        """
+        Deletes outputs previously generated from a source directory that are not part of the current build. Only
+        outputs recorded with the same input folder are considered, so the outputs of other input folders (including
+        folders nested within this one) sharing the output folder are kept
+        :param generator: Name of the generator that created the outputs
+        :param sourceDir: Input folder path
+        :param outputPaths: Paths of every output of the current build
+        :return: List of deleted output paths
+        """
+        sourceDir = os.path.abspath(sourceDir)
+        currentOutputs = set(self.outputName(outputPath) for outputPath in outputPaths)
+        removed = []
+
+        for name, entry in list(self.outputs.items()):
+            # Entries from before input folders were recorded fall back to the folder containing their source
+            entrySourceDir = entry.get("sourceDir", os.path.dirname(entry["source"]))
+            if entry["generator"] == generator and entrySourceDir == sourceDir and name not in currentOutputs:
+                orphanPath = self.outputDir + name
+                if os.path.exists(orphanPath):
+                    os.remove(orphanPath)
+                    removed.append(orphanPath)
+                self.outputs.pop(name)
+
+        return removed
+
+    def outputName(self, outputPath: str):
+        """
+        Gets the name of an output relative to the output directory, used as its key within the manifest
+        :param outputPath: Path of the output
+        :return: Relative path of the output
+        """
+        return os.path.relpath(outputPath, self.outputDir).replace("\\", "/")
+
+    def save(self):
+        """
+        Writes the manifest to the output directory, replacing the previous manifest in a single rename
+        """
+        # Drop the hashes of files that are no longer the source of any output and were not used by this build
+        sources = set(entry["source"] for entry in self.outputs.values()) | self._hashedPaths
+        self.fileHashes = {path: fileHash for path, fileHash in self.fileHashes.items() if path in sources}
+
+        temporaryPath = self.path + ".tmp"
+        with open(temporaryPath, "w", encoding="utf-8") as file:
+            json.dump({"version": BUILD_VERSION, "outputs": self.outputs, "fileHashes": self.fileHashes}, file)
+        os.replace(temporaryPath, self.path)
+
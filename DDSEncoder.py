@@ -0,0 +1,181 @@
+import struct
+import numpy as np
+from PIL import Image
+
+# DDS header flags (CAPS, HEIGHT, WIDTH, PIXELFORMAT and LINEARSIZE), MIPMAPCOUNT is added for mipmapped textures
+DDS_HEADER_FLAGS = 0x1 | 0x2 | 0x4 | 0x1000 | 0x80000
+DDS_MIPMAP_COUNT_FLAG = 0x20000
+DDS_FOURCC_FLAG = 0x4
+DDS_TEXTURE_CAPS = 0x1000
+DDS_MIPMAP_CAPS = 0x8 | 0x400000
+
+# Index of the alpha value at each step from the minimum (step 0) to the maximum (step 7)
+ALPHA_STEP_INDICES = np.array([1, 7, 6, 5, 4, 3, 2, 0], dtype=np.uint64)
+# Index of the colour at each step from the second endpoint (step 0) to the first endpoint (step 3)
+COLOUR_STEP_INDICES = np.array([1, 3, 2, 0], dtype=np.uint32)
+
+
+def splitBlocks(image: np.array):
+    """
+    Splits an RGBA image into 4x4 pixel blocks, repeating the edge pixels of images whose size is not a multiple of 4
+    :param image: uint8 array (height x width x 4)
+    :return: uint8 array of blocks (block count x 16 x 4) in row major order
+    """
+    height, width = image.shape[:2]
+    paddedHeight = (height + 3) // 4 * 4
+    paddedWidth = (width + 3) // 4 * 4
+    if (paddedHeight, paddedWidth) != (height, width):
+        image = np.pad(image, ((0, paddedHeight - height), (0, paddedWidth - width), (0, 0)), mode="edge")
+
+    blocks = image.reshape(paddedHeight // 4, 4, paddedWidth // 4, 4, 4).swapaxes(1, 2)
+    return blocks.reshape(-1, 16, 4)
+
+
+def packRGB565(colours: np.array):
+    """
+    Quantises colours to 16 bit RGB565
+    :param colours: Array of RGB values from 0 to 255 (... x 3)
+    :return: uint32 array of packed colours
+    """
+    colours = np.clip(np.rint(colours), 0, 255).astype(np.uint32)
+    return ((colours[..., 0] * 31 + 127) // 255 << 11) | ((colours[..., 1] * 63 + 127) // 255 << 5) | \
+        ((colours[..., 2] * 31 + 127) // 255)
+
+
+def unpackRGB565(packed: np.array):
+    """
+    Expands RGB565 colours back to 8 bits per channel, as the GPU does when decoding
+    :param packed: uint32 array of packed colours
+    :return: int32 array of RGB values (... x 3)
+    """
+    red = (packed >> 11) & 31
+    green = (packed >> 5) & 63
+    blue = packed & 31
+    return np.stack([(red << 3) | (red >> 2), (green << 2) | (green >> 4), (blue << 3) | (blue >> 2)],
+                    axis=-1).astype(np.int32)
+
+
+def encodeAlphaBlocks(alpha: np.array):
+    """
+    Encodes the alpha values of every block as BC3 alpha blocks, using the 8 value mode between the block's minimum
+    and maximum alpha
+    :param alpha: uint8 array of alpha values (block count x 16)
+    :return: uint64 array of encoded alpha blocks
+    """
+    alpha = alpha.astype(np.int32)
+    maximum = alpha.max(axis=1)
+    minimum = alpha.min(axis=1)
+    spread = np.maximum(maximum - minimum, 1)
+
+    # Round each value to the nearest of the 8 evenly spaced steps, blocks with a single alpha value use step 7
+    steps = (((alpha - minimum[:, None]) * 14 + spread[:, None]) // (spread[:, None] * 2)).clip(0, 7)
+    steps[maximum == minimum] = 7
+    indices = ALPHA_STEP_INDICES[steps]
+
+    encoded = maximum.astype(np.uint64) | (minimum.astype(np.uint64) << np.uint64(8))
+    shifts = np.arange(16, dtype=np.uint64) * np.uint64(3) + np.uint64(16)
+    return encoded | np.bitwise_or.reduce(indices << shifts, axis=1)
+
+
+def encodeColourBlocks(colours: np.array, alpha: np.array):
+    """
+    Encodes the colours of every block as BC1 colour blocks in the 4 colour mode, using the inset bounding box of the
+    block's visible colours as its endpoints
+    :param colours: uint8 array of RGB values (block count x 16 x 3)
+    :param alpha: uint8 array of alpha values (block count x 16), fully transparent pixels do not affect the endpoints
+    :return: uint64 array of encoded colour blocks
+    """
+    colours = colours.astype(np.int32)
+    visible = alpha > 0
+    # Blocks without a visible pixel still encode their colours, as they may be visible in lower mipmaps
+    visible[~visible.any(axis=1)] = True
+
+    maximum = np.where(visible[:, :, None], colours, -1).max(axis=1)
+    minimum = np.where(visible[:, :, None], colours, 256).min(axis=1)
+    inset = (maximum - minimum) / 16
+    firstEndpoint = packRGB565(maximum - inset)
+    secondEndpoint = packRGB565(minimum + inset)
+
+    # The 4 colour mode requires the first endpoint to be larger, equal endpoints use a single colour
+    swap = firstEndpoint < secondEndpoint
+    firstEndpoint, secondEndpoint = np.where(swap, secondEndpoint, firstEndpoint), \
+        np.where(swap, firstEndpoint, secondEndpoint)
+
+    first = unpackRGB565(firstEndpoint)
+    second = unpackRGB565(secondEndpoint)
+    palette = np.stack([second, (first + 2 * second) // 3, (2 * first + second) // 3, first], axis=1)
+    distances = ((colours[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=3)
+    indices = COLOUR_STEP_INDICES[distances.argmin(axis=2)]
+    indices[firstEndpoint == secondEndpoint] = 0
+
+    shifts = np.arange(16, dtype=np.uint32) * np.uint32(2)
+    packedIndices = np.bitwise_or.reduce(indices << shifts, axis=1)
+    return firstEndpoint.astype(np.uint64) | (secondEndpoint.astype(np.uint64) << np.uint64(16)) | \
+        (packedIndices.astype(np.uint64) << np.uint64(32))
+
+
+def encodeBC3(image: np.array):
+    """
+    Compresses an RGBA image with BC3 (DXT5)
+    :param image: uint8 array (height x width x 4)
+    :return: Compressed image data, 16 bytes for each 4x4 block
+    """
+    blocks = splitBlocks(image)
+    encoded = np.empty((len(blocks), 2), dtype="<u8")
+    encoded[:, 0] = encodeAlphaBlocks(blocks[:, :, 3])
+    encoded[:, 1] = encodeColourBlocks(blocks[:, :, :3], blocks[:, :, 3])
+    return encoded.tobytes()
+
+
+def mipmapLevels(image: Image):
+    """
+    Creates the chain of mipmaps of an image, each half the size of the previous one down to 1x1
+    :param image: RGBA image
+    :return: List of RGBA images, starting with the image itself
+    """
+    levels = [image]
+    while levels[-1].width > 1 or levels[-1].height > 1:
+        previous = levels[-1]
+        levels.append(previous.resize((max(1, previous.width // 2), max(1, previous.height // 2)), Image.BOX))
+    return levels
+
+
+def ddsHeader(width: int, height: int, mipmapCount: int):
+    """
+    Creates the header of a BC3 compressed DDS file
+    :param width: Width of the texture in pixels
+    :param height: Height of the texture in pixels
+    :param mipmapCount: Number of mipmap levels, 1 for a texture without mipmaps
+    :return: 128 byte header including the magic number
+    """
+    flags = DDS_HEADER_FLAGS | (DDS_MIPMAP_COUNT_FLAG if mipmapCount > 1 else 0)
+    caps = DDS_TEXTURE_CAPS | (DDS_MIPMAP_CAPS if mipmapCount > 1 else 0)
+    linearSize = max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * 16
+    pixelFormat = struct.pack("<II4s5I", 32, DDS_FOURCC_FLAG, b"DXT5", 0, 0, 0, 0, 0)
+    return b"DDS " + struct.pack("<7I44x", 124, flags, height, width, linearSize, 0, mipmapCount) + pixelFormat + \
+        struct.pack("<5I", caps, 0, 0, 0, 0)
+
+
+def encodeDDS(image: Image, mipmaps: bool = False):
+    """
+    Encodes an image as a BC3 (DXT5) compressed DDS texture
+    :param image: Image to encode
+    :param mipmaps: Whether to include every mipmap level
+    :return: Bytes of the DDS file
+    """
+    image = image if image.mode == "RGBA" else image.convert("RGBA")
+    levels = mipmapLevels(image) if mipmaps else [image]
+    return ddsHeader(image.width, image.height, len(levels)) + \
+        b"".join(encodeBC3(np.asarray(level)) for level in levels)
+
+
+def saveDDS(image: Image, filePath: str, mipmaps: bool = False):
+    """
+    Saves an image as a BC3 (DXT5) compressed DDS texture
+    :param image: Image to save
+    :param filePath: Output path
+    :param mipmaps: Whether to include every mipmap level
+    """
+    content = encodeDDS(image, mipmaps)
+    with open(filePath, "wb") as file:
+        file.write(content)
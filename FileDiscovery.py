@@ -0,0 +1,120 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+
+
+class DiscoveredFile:
+    __slots__ = ("path", "size", "modifiedTime")
+
+    def __init__(self, path: str, size: int, modifiedTime: int):
+        """
+        A file found by discoverFiles, with the stat data already read while listing its directory
+        :param path: Path of the file relative to the searched directory, using forward slashes
+        :param size: Size of the file in bytes
+        :param modifiedTime: Modification time of the file in nanoseconds
+        """
+        self.path = path
+        self.size = size
+        self.modifiedTime = modifiedTime
+
+    def __repr__(self):
+        return f"DiscoveredFile({self.path!r}, {self.size}, {self.modifiedTime})"
+
+
+def matchesAny(path: str, patterns: [str]):
+    """
+    Checks a relative path against glob patterns, each pattern is tried against both the path and the file name
+    :param path: Path relative to the searched directory, using forward slashes
+    :param patterns: Glob patterns such as "*.png" or "gfx/leaders/*"
+    :return: True if any pattern matches, otherwise False
+    """
+    name = path.rsplit("/", 1)[-1]
+    return any(fnmatch(path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def _scanDirectory(root: str, relativeDir: str, extensions, recursive: bool, include: [str], exclude: [str],
+                   skipHidden: bool, files: list):
+    """
+    Appends the matching files of a directory (and its subdirectories when recursive) to a list, parameters are as
+    described in discoverFiles
+    :param relativeDir: Directory to scan relative to the root (ending with a slash, or empty for the root)
+    :param files: List the DiscoveredFiles are appended to
+    """
+    directories = [relativeDir]
+
+    while len(directories) > 0:
+        currentDir = directories.pop()
+        try:
+            with os.scandir(root + currentDir) as entries:
+                for entry in entries:
+                    if skipHidden and entry.name.startswith("."):
+                        continue
+
+                    relativePath = currentDir + entry.name
+                    # Symlinked directories are not followed, as a link to a parent directory would never finish
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and (exclude is None or not matchesAny(relativePath, exclude)):
+                            directories.append(relativePath + "/")
+                        continue
+                    if entry.is_dir():
+                        continue
+
+                    if extensions is not None and not entry.name.lower().endswith(extensions):
+                        continue
+                    if include is not None and not matchesAny(relativePath, include):
+                        continue
+                    if exclude is not None and matchesAny(relativePath, exclude):
+                        continue
+
+                    # DirEntry caches its stat result, on Windows without any further system call
+                    try:
+                        entryStat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append(DiscoveredFile(relativePath, entryStat.st_size, entryStat.st_mtime_ns))
+        except OSError:
+            # Only a missing or unreadable top level directory is an error, subdirectories may vanish mid scan
+            if currentDir == "":
+                raise
+            continue
+
+
+def discoverFiles(directory: str, extensions: tuple = None, recursive: bool = False, include: [str] = None,
+                  exclude: [str] = None, skipHidden: bool = False, workers: int = 1):
+    """
+    Lists the files of a directory using os.scandir, optionally walking every subdirectory
+    :param directory: Directory to search (ending with a slash)
+    :param extensions: Lower case file extensions to keep (such as (".png", ".dds")), None keeps every file
+    :param recursive: Whether to search subdirectories
+    :param include: Glob patterns a file must match to be kept, None keeps every file
+    :param exclude: Glob patterns of files and subdirectories to leave out
+    :param skipHidden: Whether to leave out files and directories starting with a dot
+    :param workers: Number of threads walking the top level subdirectories in parallel, None uses every core
+    :return: List of DiscoveredFiles sorted by path
+    """
+    files = []
+
+    if not recursive or workers == 1:
+        _scanDirectory(directory, "", extensions, recursive, include, exclude, skipHidden, files)
+    else:
+        # Files directly within the directory are listed first, then each top level subtree is walked on its own thread
+        _scanDirectory(directory, "", extensions, False, include, exclude, skipHidden, files)
+        try:
+            with os.scandir(directory) as entries:
+                subdirectories = [entry.name + "/" for entry in entries if entry.is_dir(follow_symlinks=False) and
+                                  not (skipHidden and entry.name.startswith(".")) and
+                                  (exclude is None or not matchesAny(entry.name, exclude))]
+        except OSError:
+            subdirectories = []
+
+        subtreeFiles = [[] for subdirectory in subdirectories]
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            # Consuming the results re-raises any exception from the threads
+            list(executor.map(lambda subdirectory, results: _scanDirectory(directory, subdirectory, extensions, True,
+                                                                           include, exclude, skipHidden, results),
+                              subdirectories, subtreeFiles))
+        for results in subtreeFiles:
+            files.extend(results)
+
+    files.sort(key=lambda discoveredFile: discoveredFile.path)
+    return files
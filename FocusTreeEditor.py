@@ -0,0 +1,131 @@
+import difflib
+import os
+import shutil
+import tempfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from ParadoxScript import BYTE_ORDER_MARK, formatValue, parseEntries
+from ParadoxUtils import listTextFiles
+
+
+class FocusTreeInsertion:
+    def __init__(self, key: str, value):
+        """
+        An edit that adds a key = value line to the start of the first focus_tree block of a file, unless the block
+        already contains that exact line
+        :param key: Key of the line (such as "shared_focus")
+        :param value: Value of the line
+        """
+        self.key = key
+        self.value = value
+
+    def __repr__(self):
+        return f"FocusTreeInsertion({self.key!r}, {self.value!r})"
+
+    def apply(self, text: str):
+        """
+        Applies the edit to the text of a focus tree file
+        :param text: Text of the file
+        :return: Edited text, None if the file has no focus_tree block or already contains the edit
+        """
+        # Only the first top level focus_tree block is edited, ignoring any within comments or strings
+        focusTree = next((node for node in parseEntries(text) if node.key == "focus_tree" and node.isBlock), None)
+        if focusTree is None:
+            return None
+        if any(child.value == str(self.value) for child in focusTree.find(self.key)):
+            return None
+
+        # Match the indentation of the first line within the block and the file's line endings
+        newline = "\r\n" if "\r\n" in text else "\n"
+        children = focusTree.children
+        indent = "\t"
+        if len(children) > 0:
+            lineStart = text.rfind("\n", 0, children[0].start) + 1
+            leading = text[lineStart:children[0].start]
+            indent = leading[:len(leading) - len(leading.lstrip(" \t"))] or indent
+
+        insertAt = focusTree.start + 1
+        return text[:insertAt] + newline + indent + f"{self.key} = {formatValue(self.value)}" + text[insertAt:]
+
+
+def addSharedFocus(sharedFocus: str):
+    """
+    Creates the edit that adds a shared focus to a focus tree
+    :param sharedFocus: Name of the shared focus
+    :return: FocusTreeInsertion
+    """
+    return FocusTreeInsertion("shared_focus", sharedFocus)
+
+
+def writeFileAtomically(filePath: str, content: bytes):
+    """
+    Replaces a file by writing a temporary file in the same directory and renaming it over the original, so an
+    interrupted write never leaves a half-written file
+    :param filePath: Path to the file
+    :param content: New content of the file
+    """
+    directory = os.path.dirname(os.path.abspath(filePath))
+    fileDescriptor, temporaryPath = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fileDescriptor, "wb") as file:
+            file.write(content)
+        shutil.copymode(filePath, temporaryPath)
+        os.replace(temporaryPath, filePath)
+    except BaseException:
+        os.remove(temporaryPath)
+        raise
+
+
+def editFocusTree(filePath: str, edits: list, dryRun: bool = False, displayPath: str = None):
+    """
+    Applies a list of edits to a single focus tree file
+    :param filePath: Path to the focus tree file
+    :param edits: Edits with an apply(text) method, such as FocusTreeInsertion
+    :param dryRun: Whether to only create the diff without writing the file
+    :param displayPath: Path shown in the diff, defaults to filePath
+    :return: Tuple of (file path, status, unified diff), status is "edited", "unchanged" or "failed" (with the error
+    in place of the diff)
+    """
+    try:
+        with open(filePath, "rb") as file:
+            content = file.read()
+
+        # Keep the byte order mark and line endings of the original file
+        byteOrderMark = BYTE_ORDER_MARK if content.startswith(BYTE_ORDER_MARK) else b""
+        oldText = content[len(byteOrderMark):].decode("utf-8")
+
+        newText = oldText
+        for edit in edits:
+            editedText = edit.apply(newText)
+            if editedText is not None:
+                newText = editedText
+
+        if newText == oldText:
+            return filePath, "unchanged", ""
+
+        displayPath = filePath if displayPath is None else displayPath
+        diff = "".join(difflib.unified_diff(oldText.splitlines(keepends=True), newText.splitlines(keepends=True),
+                                            "a/" + displayPath, "b/" + displayPath))
+        if not dryRun:
+            writeFileAtomically(filePath, byteOrderMark + newText.encode("utf-8"))
+        return filePath, "edited", diff
+    except Exception:
+        return filePath, "failed", traceback.format_exc()
+
+
+def editFocusTrees(inputDir: str, edits: list, dryRun: bool = False, recursive: bool = False, workers: int = None):
+    """
+    Applies a list of edits to every focus tree file within a directory on a thread pool. Files that already contain
+    every edit are left untouched
+    :param inputDir: Input directory (ending with a slash)
+    :param edits: Edits with an apply(text) method, such as FocusTreeInsertion
+    :param dryRun: Whether to only create the diffs without writing any file
+    :param recursive: Whether to also edit the files of every subfolder
+    :param workers: Number of threads, None uses the executor's default
+    :return: List of (file path, status, unified diff) tuples in file order, from editFocusTree
+    """
+    focusTrees = listTextFiles(inputDir, recursive)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda focusTree: editFocusTree(inputDir + focusTree, edits, dryRun, focusTree),
+                                 focusTrees))
@@ -0,0 +1,83 @@
+import os
+import struct
+
+# Bytes read from the start of an image, enough for every header except JPEGs with large metadata segments
+HEADER_SIZE = 64
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+DDS_MAGIC = b"DDS "
+
+# JPEG start of frame markers, which hold the image size (every SOFn except DHT, JPG and DAC)
+JPEG_FRAME_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def probeImageSize(filePath: str):
+    """
+    Reads the size of a PNG, JPEG, BMP, DDS or TGA image from its header, without decoding any pixels
+    :param filePath: Path to the image
+    :return: Tuple of (width, height), None if the format is not recognised or the header is malformed
+    """
+    try:
+        with open(filePath, "rb") as file:
+            header = file.read(HEADER_SIZE)
+
+            if header.startswith(PNG_SIGNATURE) and header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+            if header.startswith(DDS_MAGIC) and len(header) >= 20:
+                height, width = struct.unpack("<II", header[12:20])
+                return width, height
+            if header.startswith(b"BM") and len(header) >= 26:
+                return probeBMPSize(header)
+            if header.startswith(b"\xff\xd8"):
+                file.seek(2)
+                return probeJPEGSize(file)
+            if filePath.lower().endswith(".tga") and len(header) >= 18:
+                return struct.unpack("<HH", header[12:16])
+    except (OSError, struct.error):
+        pass
+
+    return None
+
+
+def probeBMPSize(header: bytes):
+    """
+    Reads the size of a BMP image from its header
+    :param header: First bytes of the file
+    :return: Tuple of (width, height)
+    """
+    # OS/2 BMPs use a 12 byte header with 16 bit sizes, every later header uses signed 32 bit sizes
+    if struct.unpack("<I", header[14:18])[0] == 12:
+        return struct.unpack("<HH", header[18:22])
+    width, height = struct.unpack("<ii", header[18:26])
+    # Negative heights mark top-down BMPs
+    return width, abs(height)
+
+
+def probeJPEGSize(file):
+    """
+    Reads the size of a JPEG image by skipping segments until the start of frame, without reading any scan data
+    :param file: Binary file handle positioned after the start of image marker
+    :return: Tuple of (width, height), None if no start of frame marker was found
+    """
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+
+        # Fill bytes may pad markers
+        while marker[1] == 0xFF:
+            marker = marker[1:] + file.read(1)
+            if len(marker) < 2:
+                return None
+
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            # Markers without a length
+            continue
+        if marker[1] == 0xD9:
+            return None
+
+        segmentLength = struct.unpack(">H", file.read(2))[0]
+        if marker[1] in JPEG_FRAME_MARKERS:
+            height, width = struct.unpack(">xHH", file.read(5))
+            return width, height
+        file.seek(segmentLength - 2, os.SEEK_CUR)
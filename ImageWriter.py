@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# zlib's default compression level, which Pillow also uses for PNGs
+DEFAULT_COMPRESS_LEVEL = -1
+
+
+def saveImage(image, filePath: str, compressLevel: int = DEFAULT_COMPRESS_LEVEL, optimize: bool = False,
+              mipmaps: bool = False):
+    """
+    Saves an image, creating its folder if needed, and closes the image once it is written
+    :param image: PIL image to save
+    :param filePath: Output path, the format is chosen from its extension. DDS files are BC3 (DXT5) compressed
+    :param compressLevel: PNG compression level from 0 to 9, -1 uses zlib's default
+    :param optimize: Whether to spend extra time making PNGs as small as possible
+    :param mipmaps: Whether DDS files include every mipmap level
+    :return: Seconds spent encoding and writing the image
+    """
+    startTime = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        if filePath.lower().endswith(".dds"):
+            # Imported here so the GUI does not load numpy on startup
+            from DDSEncoder import saveDDS
+            saveDDS(image, filePath, mipmaps)
+        elif filePath.lower().endswith(".png"):
+            image.save(filePath, compress_level=compressLevel, optimize=optimize)
+        else:
+            image.save(filePath)
+    finally:
+        image.close()
+    return time.perf_counter() - startTime
+
+
+class ImageWriter:
+    def __init__(self, workers: int = 2, maxPending: int = 8, compressLevel: int = DEFAULT_COMPRESS_LEVEL,
+                 optimize: bool = False, mipmaps: bool = False):
+        """
+        Encodes and writes images on a thread pool while the next images are being generated. Pillow releases the GIL
+        while encoding, so writing overlaps with generation. At most maxPending images are held in memory, submit
+        blocks until a slot is free
+        :param workers: Number of writer threads
+        :param maxPending: Maximum number of images queued or being written at once
+        :param compressLevel: PNG compression level from 0 to 9, -1 uses zlib's default
+        :param optimize: Whether to spend extra time making PNGs as small as possible
+        :param mipmaps: Whether DDS files include every mipmap level
+        """
+        self.compressLevel = compressLevel
+        self.optimize = optimize
+        self.mipmaps = mipmaps
+        self.imagesWritten = 0
+        self.imagesSkipped = 0
+        self.computeSeconds = 0.0
+        self.encodeSeconds = 0.0
+        self.waitSeconds = 0.0
+
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(maxPending)
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def submit(self, image, filePath: str):
+        """
+        Queues an image to be saved (and then closed) on a writer thread, waiting while maxPending images are queued
+        :param image: PIL image to save, it must not be changed after it is submitted
+        :param filePath: Output path
+        :return: Future whose result is None once the image is written, or which raises the write error
+        """
+        startTime = time.perf_counter()
+        self._slots.acquire()
+        self.waitSeconds += time.perf_counter() - startTime
+
+        try:
+            future = self._executor.submit(self._write, image, filePath)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._finished)
+        return future
+
+    def write(self, image, filePath: str):
+        """
+        Saves (and then closes) an image on the calling thread, counting the time spent like submitted images
+        :param image: PIL image to save
+        :param filePath: Output path
+        """
+        seconds = saveImage(image, filePath, self.compressLevel, self.optimize, self.mipmaps)
+        self.record(encodeSeconds=seconds, imagesWritten=1)
+
+    def record(self, computeSeconds: float = 0.0, encodeSeconds: float = 0.0, imagesWritten: int = 0,
+               imagesSkipped: int = 0):
+        """
+        Adds to the timings of the writer, used for generation time and for images written by other processes
+        :param computeSeconds: Seconds spent generating images
+        :param encodeSeconds: Seconds spent encoding and writing images
+        :param imagesWritten: Number of images written
+        :param imagesSkipped: Number of source images skipped as their outputs were already up to date
+        """
+        with self._lock:
+            self.computeSeconds += computeSeconds
+            self.encodeSeconds += encodeSeconds
+            self.imagesWritten += imagesWritten
+            self.imagesSkipped += imagesSkipped
+
+    def flush(self):
+        """
+        Waits until every submitted image has been written
+        """
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    def close(self):
+        """
+        Waits until every submitted image has been written and stops the writer threads
+        """
+        self._executor.shutdown(wait=True)
+
+    def report(self):
+        """
+        Gets the timings of every image generated and written through the writer
+        :return: Dictionary of the number of images written, number of source images skipped as up to date, seconds
+        spent generating, seconds spent encoding and writing (summed across threads and processes) and seconds
+        generation waited for a free slot
+        """
+        return {
+            "images": self.imagesWritten,
+            "skipped": self.imagesSkipped,
+            "computeSeconds": round(self.computeSeconds, 3),
+            "encodeSeconds": round(self.encodeSeconds, 3),
+            "waitSeconds": round(self.waitSeconds, 3),
+        }
+
+    def summary(self):
+        """
+        :return: Single line description of the report
+        """
+        return f"{self.imagesWritten} images written, {self.imagesSkipped} skipped as up to date: " \
+               f"{self.computeSeconds:.2f}s generating, {self.encodeSeconds:.2f}s encoding, " \
+               f"{self.waitSeconds:.2f}s waiting for the writer"
+
+    def _write(self, image, filePath: str):
+        """
+        Writer thread entry point, saves an image and frees its slot
+        :param image: PIL image to save
+        :param filePath: Output path
+        """
+        try:
+            self.write(image, filePath)
+        finally:
+            self._slots.release()
+
+    def _finished(self, future):
+        """
+        Removes a written image from the pending set
+        :param future: Future of the written image
+        """
+        with self._lock:
+            self._pending.discard(future)
@@ -0,0 +1,85 @@
+import os
+import re
+
+from ModIndex import ModIndex
+
+# Language of a localisation file, from its name (such as "focus_l_english.yml")
+LOCALISATION_LANGUAGE_PATTERN = re.compile(r"l_(\w+)\.yml$", re.IGNORECASE)
+
+
+def localisationLanguage(path: str):
+    """
+    Gets the language of a localisation file from its name
+    :param path: Path to the localisation file
+    :return: Language of the file (such as "english"), None if the name does not contain one
+    """
+    match = LOCALISATION_LANGUAGE_PATTERN.search(os.path.basename(path))
+    return match.group(1).lower() if match is not None else None
+
+
+def findDuplicates(locations: dict):
+    """
+    Finds the symbols that are declared more than once
+    :param locations: Dictionary mapping each symbol name to every file it is declared in, from symbolLocations
+    :return: List of {"name", "files"} dictionaries sorted by name
+    """
+    return [{"name": name, "files": sorted(paths)} for name, paths in sorted(locations.items()) if len(paths) > 1]
+
+
+def findMissing(references: dict, defined: set):
+    """
+    Finds the referenced symbols that are not declared
+    :param references: Dictionary mapping each referenced name to every file referencing it, from symbolLocations
+    :param defined: Set of declared names
+    :return: List of {"name", "files"} dictionaries sorted by name
+    """
+    return [{"name": name, "files": sorted(set(paths))} for name, paths in sorted(references.items())
+            if name not in defined]
+
+
+def checkMod(modRoot: str, spritePrefix: str = "GFX_", workers: int = None):
+    """
+    Checks a mod for missing textures, sprites and focus localisation, and for symbols declared more than once.
+    Symbols are read from the mod index, so only files changed since the last check are read again
+    :param modRoot: Directory for the root of the mod (ending with a slash)
+    :param spritePrefix: Prefix of the sprite references to check (such as "GFX_")
+    :param workers: Number of worker processes refreshing the index, None uses every core
+    :return: Report dictionary with "missing" and "duplicates" sections and the number of problems found
+    """
+    with ModIndex(modRoot, spritePrefix) as index:
+        index.refresh(workers)
+
+        # Paths are compared in lower case with forward slashes, as the game does on Windows
+        texturePaths = set(path.lower() for path in index.filePaths("image"))
+        textureReferences = {}
+        for name, paths in index.symbolLocations("textureReference").items():
+            textureReferences.setdefault(name.replace("\\", "/").lower(), []).extend(paths)
+
+        spriteReferences = index.symbolLocations("spriteReference")
+        focuses = index.symbolLocations("focus")
+
+        # Localisation keys are only duplicates within the same language
+        localisationByLanguage = {}
+        for name, paths in index.symbolLocations("localisation").items():
+            for path in paths:
+                localisationByLanguage.setdefault(localisationLanguage(path), {}).setdefault(name, []).append(path)
+        englishKeys = set(localisationByLanguage.get("english", {}))
+
+        report = {
+            "missing": {
+                "textures": findMissing(textureReferences, texturePaths),
+                "sprites": findMissing(spriteReferences, index.symbolNames("sprite")),
+                "localisation": findMissing(focuses, englishKeys),
+            },
+            "duplicates": {
+                "sprites": findDuplicates(index.symbolLocations("sprite")),
+                "focuses": findDuplicates(focuses),
+                "characters": findDuplicates(index.symbolLocations("character")),
+                "localisation": [duplicate for language in sorted(localisationByLanguage, key=str)
+                                 for duplicate in findDuplicates(localisationByLanguage[language])],
+            },
+        }
+
+    report["problems"] = sum(len(items) for section in ("missing", "duplicates")
+                             for items in report[section].values())
+    return report
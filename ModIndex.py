@@ -0,0 +1,254 @@
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from FileDiscovery import discoverFiles
+from ParadoxScript import VALUE_TOKENS, mapScriptFile, tokenize
+from ParadoxUtils import DISCOVERY_WORKERS, IMAGE_EXTENSIONS, LOCALISATION_KEY_PATTERN_BYTES, TEXT_EXTENSIONS
+
+INDEX_FILE_NAME = ".hoi4_utility_index.sqlite"
+
+# Increase when extractSymbols changes, so every file is indexed again
+INDEX_VERSION = 2
+
+# Kind of each indexed file, by extension. Textures are also indexed as .tga since the game can reference them
+INDEXED_EXTENSIONS = {
+    **{extension: "script" for extension in TEXT_EXTENSIONS},
+    ".gfx": "gfx",
+    ".yml": "localisation",
+    **{extension: "image" for extension in IMAGE_EXTENSIONS + (".tga",)},
+}
+
+# Blocks of a .gfx file whose "name" declares a sprite
+SPRITE_BLOCKS = {"spriteType", "corneredTileSpriteType", "frameAnimatedSpriteType", "progressbartype"}
+
+# Blocks of a focus file whose "id" declares a focus
+FOCUS_BLOCKS = {"focus", "shared_focus"}
+
+# Default prefix of sprite names referenced from script files
+SPRITE_PREFIX = "GFX_"
+
+
+def extractSymbols(filePath: str, kind: str, spritePrefix: str = SPRITE_PREFIX):
+    """
+    Extracts every symbol declared or referenced within a mod file in a single pass
+    :param filePath: Path to the file
+    :param kind: Kind of the file from INDEXED_EXTENSIONS
+    :param spritePrefix: Prefix of the values within script files recorded as sprite references
+    :return: List of (symbol kind, name) tuples in the order they appear in the file
+    """
+    if kind == "image":
+        return []
+
+    with mapScriptFile(filePath) as source:
+        if kind == "localisation":
+            return [("localisation", key.decode("utf-8", "replace"))
+                    for key in LOCALISATION_KEY_PATTERN_BYTES.findall(source)]
+
+        symbols = []
+        # Keys of the blocks currently open, None for anonymous blocks
+        stack = []
+        tokens = tokenize(source)
+        pending = None
+
+        for tokenKind, value, tokenStart, tokenEnd in tokens:
+            if tokenKind == "operator" and pending is not None:
+                key = pending
+                pending = None
+                nextToken = next(tokens, None)
+                if nextToken is None:
+                    break
+
+                parent = stack[-1] if len(stack) > 0 else None
+                if nextToken[0] == "open":
+                    if kind == "script" and len(stack) == 1 and parent == "characters":
+                        symbols.append(("character", key))
+                    stack.append(key)
+                    continue
+                if nextToken[0] not in VALUE_TOKENS:
+                    continue
+
+                value = nextToken[1]
+                if kind == "gfx":
+                    if key == "name" and parent in SPRITE_BLOCKS:
+                        symbols.append(("sprite", value))
+                    elif key == "texturefile":
+                        symbols.append(("textureReference", value))
+                else:
+                    if key == "id" and parent in FOCUS_BLOCKS:
+                        symbols.append(("focus", value))
+                    elif key == "id" and parent == "focus_tree":
+                        symbols.append(("focusTree", value))
+                    elif key == "token_base":
+                        symbols.append(("character", value))
+                    if value.startswith(spritePrefix):
+                        symbols.append(("spriteReference", value))
+                continue
+
+            pending = value if tokenKind in VALUE_TOKENS else None
+            if tokenKind == "open":
+                stack.append(None)
+            elif tokenKind == "close" and len(stack) > 0:
+                stack.pop()
+
+        return symbols
+
+
+def _extractSymbolsTask(task):
+    """
+    Worker process entry point for extractSymbols
+    :param task: Tuple of (file path, kind, sprite prefix)
+    :return: List of (symbol kind, name) tuples, None if the file could not be read
+    """
+    try:
+        return extractSymbols(*task)
+    except OSError:
+        return None
+
+
+def scanModFiles(modRoot: str):
+    """
+    Lists every indexed file under the mod root, skipping hidden files and directories
+    :param modRoot: Directory for the root of the mod (ending with a slash)
+    :return: Dictionary mapping each file's path relative to the mod root to its (kind, size, modified time)
+    """
+    return {f.path: (INDEXED_EXTENSIONS[os.path.splitext(f.path)[1].lower()], f.size, f.modifiedTime)
+            for f in discoverFiles(modRoot, tuple(INDEXED_EXTENSIONS), recursive=True, skipHidden=True,
+                                   workers=DISCOVERY_WORKERS)}
+
+
+class ModIndex:
+    def __init__(self, modRoot: str, spritePrefix: str = SPRITE_PREFIX):
+        """
+        Opens the persistent index of every script, GFX, localisation and image file of a mod along with the symbols
+        they declare and reference. The index is stored in a SQLite file within the mod root and only changed files are
+        read again on refresh
+        :param modRoot: Directory for the root of the mod (ending with a slash)
+        :param spritePrefix: Prefix of the values within script files recorded as sprite references. An index built
+        with another prefix is emptied, so every file is read again on the next refresh
+        """
+        self.modRoot = modRoot
+        self.spritePrefix = spritePrefix
+        self.path = modRoot + INDEX_FILE_NAME
+        self.connection = sqlite3.connect(self.path)
+
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            self.connection.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS symbols;")
+            self.connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, kind TEXT, size INTEGER, mtime INTEGER);
+            CREATE TABLE IF NOT EXISTS symbols (path TEXT, kind TEXT, name TEXT);
+            CREATE INDEX IF NOT EXISTS symbolsByName ON symbols (kind, name);
+            CREATE INDEX IF NOT EXISTS symbolsByPath ON symbols (path);
+            CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+        storedPrefix = self.connection.execute("SELECT value FROM settings WHERE key = 'spritePrefix'").fetchone()
+        if storedPrefix is None or storedPrefix[0] != spritePrefix:
+            with self.connection:
+                self.connection.execute("DELETE FROM files")
+                self.connection.execute("DELETE FROM symbols")
+                self.connection.execute("INSERT OR REPLACE INTO settings VALUES ('spritePrefix', ?)", (spritePrefix,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the index file
+        """
+        self.connection.close()
+
+    def refresh(self, workers: int = 1):
+        """
+        Brings the index up to date with the mod, only reading files whose size or modification time changed
+        :param workers: Number of worker processes reading changed files, None uses every core
+        :return: Tuple of (number of files indexed again, number of files removed)
+        """
+        knownFiles = {path: (size, mtime) for path, size, mtime in
+                      self.connection.execute("SELECT path, size, mtime FROM files")}
+        currentFiles = scanModFiles(self.modRoot)
+
+        removedPaths = [path for path in knownFiles if path not in currentFiles]
+        changedPaths = [path for path, (kind, size, mtime) in currentFiles.items()
+                        if knownFiles.get(path) != (size, mtime)]
+
+        tasks = [(self.modRoot + path, currentFiles[path][0], self.spritePrefix) for path in changedPaths]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        # Starting worker processes costs more than reading a few dozen files
+        workers = max(1, min(workers, len(tasks) // 64))
+
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            if executor is None:
+                taskResults = (_extractSymbolsTask(task) for task in tasks)
+            else:
+                taskResults = executor.map(_extractSymbolsTask, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+            with self.connection:
+                self.connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removedPaths))
+                self.connection.executemany("DELETE FROM symbols WHERE path = ?",
+                                            ((path,) for path in removedPaths + changedPaths))
+
+                for path, symbols in zip(changedPaths, taskResults):
+                    # Files that cannot be read are left out and retried on the next refresh
+                    if symbols is None:
+                        continue
+
+                    kind, size, mtime = currentFiles[path]
+                    self.connection.executemany("INSERT INTO symbols VALUES (?, ?, ?)",
+                                                ((path, symbolKind, name) for symbolKind, name in symbols))
+                    self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                            (path, kind, size, mtime))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        return len(changedPaths), len(removedPaths)
+
+    def filePaths(self, kind: str = None):
+        """
+        Gets the paths of every indexed file, relative to the mod root
+        :param kind: Kind of file from INDEXED_EXTENSIONS, None for every kind
+        :return: Set of file paths
+        """
+        if kind is None:
+            return set(path for path, in self.connection.execute("SELECT path FROM files"))
+        return set(path for path, in self.connection.execute("SELECT path FROM files WHERE kind = ?", (kind,)))
+
+    def symbolNames(self, kind: str):
+        """
+        Gets the name of every symbol of a kind
+        :param kind: Kind of symbol (such as "focus", "sprite" or "localisation")
+        :return: Set of symbol names
+        """
+        return set(name for name, in self.connection.execute("SELECT DISTINCT name FROM symbols WHERE kind = ?",
+                                                              (kind,)))
+
+    def symbolLocations(self, kind: str):
+        """
+        Gets every file each symbol of a kind appears in, a file is repeated for each time the symbol appears in it
+        :param kind: Kind of symbol (such as "focus", "sprite" or "localisation")
+        :return: Dictionary mapping each symbol name to a list of file paths
+        """
+        locations = {}
+        for name, path in self.connection.execute("SELECT name, path FROM symbols WHERE kind = ? ORDER BY rowid",
+                                                  (kind,)):
+            locations.setdefault(name, []).append(path)
+        return locations
+
+    def hasSymbol(self, kind: str, name: str):
+        """
+        Checks if a symbol exists anywhere within the mod
+        :param kind: Kind of symbol (such as "focus", "sprite" or "localisation")
+        :param name: Name of the symbol
+        :return: True if the symbol exists, otherwise False
+        """
+        return self.connection.execute("SELECT 1 FROM symbols WHERE kind = ? AND name = ? LIMIT 1",
+                                       (kind, name)).fetchone() is not None
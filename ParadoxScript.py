@@ -0,0 +1,343 @@
+import mmap
+import os
+import re
+from contextlib import contextmanager
+
+# Characters that can appear in an unquoted Paradox script value
+BARE_VALUE_PATTERN = re.compile(r"[\w.:@\-/\\|%$'+]+")
+
+
+def formatValue(value, quote: bool = None):
+    """
+    Formats a value for a Paradox script file
+    :param value: Value to format (string, number or bool)
+    :param quote: True to always quote the value, False to never quote it, None to only quote it if it needs quotes
+    :return: Formatted value
+    """
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, (int, float)):
+        return str(value)
+
+    value = str(value)
+    if quote is None:
+        quote = BARE_VALUE_PATTERN.fullmatch(value) is None
+    if quote:
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return value
+
+
+class ParadoxWriter:
+    def __init__(self, file, indent: str = "    "):
+        """
+        Writes Paradox script (keys, values and nested blocks) directly to a text file handle
+        :param file: Text file handle to write to
+        :param indent: String used to indent each level of nesting
+        """
+        self.file = file
+        self.indent = indent
+        self.depth = 0
+
+    def assign(self, key: str, value, quote: bool = None, operator: str = "="):
+        """
+        Writes a single key = value line, keys may be repeated
+        :param key: Key of the line
+        :param value: Value of the line
+        :param quote: True to always quote the value, False to never quote it, None to only quote it if it needs quotes
+        :param operator: Operator between the key and value
+        """
+        self.file.write(f"{self.indent * self.depth}{key} {operator} {formatValue(value, quote)}\n")
+
+    def openBlock(self, key: str):
+        """
+        Writes the opening line of a key = { ... } block, every following line is nested within the block until
+        closeBlock is called
+        :param key: Key of the block
+        """
+        self.file.write(f"{self.indent * self.depth}{key} = {{\n")
+        self.depth += 1
+
+    def closeBlock(self):
+        """
+        Writes the closing brace of the most recently opened block
+        """
+        if self.depth == 0:
+            raise ValueError("No block is open")
+        self.depth -= 1
+        self.file.write(f"{self.indent * self.depth}}}\n")
+
+    def emptyBlock(self, key: str):
+        """
+        Writes a key = { } block with no contents
+        :param key: Key of the block
+        """
+        self.file.write(f"{self.indent * self.depth}{key} = {{ }}\n")
+
+    def comment(self, text: str):
+        """
+        Writes a comment line
+        :param text: Text of the comment
+        """
+        self.file.write(f"{self.indent * self.depth}# {text}\n")
+
+    @contextmanager
+    def block(self, key: str):
+        """
+        Context manager that writes a key = { ... } block around everything written within it
+        :param key: Key of the block
+        """
+        self.openBlock(key)
+        yield self
+        self.closeBlock()
+
+
+# Quoted strings and comments are matched as single tokens, so braces and operators within them are ignored
+TOKEN_REGEX = r"""
+    (?P<comment>\#[^\r\n]*)
+  | (?P<open>\{)
+  | (?P<close>\})
+  | (?P<operator><=|>=|!=|==|\?=|=|<|>)
+  | (?P<string>"(?:[^"\\]|\\.)*"?)
+  | (?P<word>[^\s{}=<>!?#"]+)
+"""
+TOKEN_PATTERN = re.compile(TOKEN_REGEX, re.VERBOSE)
+BYTES_TOKEN_PATTERN = re.compile(TOKEN_REGEX.encode("ascii"), re.VERBOSE)
+
+VALUE_TOKENS = ("word", "string")
+BYTE_ORDER_MARK = b"\xef\xbb\xbf"
+
+
+def tokenize(source, start: int = 0, end: int = None):
+    """
+    Splits Paradox script into tokens in a single pass, skipping whitespace and comments
+    :param source: Script as a string, bytes or a memory-mapped file
+    :param start: Offset to start tokenizing from
+    :param end: Offset to stop tokenizing at, defaults to the end of the source
+    :return: Generator of (kind, value, start offset, end offset) tuples, where kind is "open", "close", "operator",
+    "string" or "word". String values have their quotes and escapes removed
+    """
+    isText = isinstance(source, str)
+    pattern = TOKEN_PATTERN if isText else BYTES_TOKEN_PATTERN
+    if end is None:
+        end = len(source)
+
+    # Skip the byte order mark that some Paradox files start with
+    byteOrderMark = BYTE_ORDER_MARK.decode("utf-8") if isText else BYTE_ORDER_MARK
+    if start == 0 and source[:len(byteOrderMark)] == byteOrderMark:
+        start = len(byteOrderMark)
+
+    for match in pattern.finditer(source, start, end):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+
+        value = match.group()
+        if not isText:
+            value = value.decode("utf-8", "replace")
+        if kind == "string":
+            value = value[1:-1] if len(value) > 1 and value.endswith('"') else value[1:]
+            if "\\" in value:
+                value = re.sub(r"\\(.)", r"\1", value)
+
+        yield kind, value, match.start(), match.end()
+
+
+class ScriptNode:
+    __slots__ = ("key", "operator", "value", "start", "end", "_source", "_children")
+
+    def __init__(self, key, operator, value, start: int, end: int, source=None):
+        """
+        An entry of a Paradox script, either key = value, key = { ... } or a bare value within a list
+        :param key: Key of the entry, None for bare values and anonymous blocks
+        :param operator: Operator between the key and value, None for bare values and anonymous blocks
+        :param value: Value of the entry, None for blocks (their contents are accessed through children)
+        :param start: Offset of the value within the source (the opening brace for blocks)
+        :param end: Offset after the end of the value (after the closing brace for blocks)
+        :param source: Source the block was parsed from, None for entries that are not blocks
+        """
+        self.key = key
+        self.operator = operator
+        self.value = value
+        self.start = start
+        self.end = end
+        self._source = source
+        self._children = None
+
+    def __repr__(self):
+        return f"ScriptNode(key={self.key!r}, operator={self.operator!r}, value={self.value!r})"
+
+    @property
+    def isBlock(self):
+        """
+        :return: True if the entry is a { ... } block
+        """
+        return self._source is not None
+
+    @property
+    def children(self):
+        """
+        Entries within a block, only parsed the first time they are accessed
+        :return: List of child ScriptNodes, empty for entries that are not blocks
+        """
+        if self._children is None:
+            self._children = [] if self._source is None else \
+                list(parseEntries(self._source, self.start + 1, self.end - 1))
+        return self._children
+
+    def find(self, key: str):
+        """
+        Finds the children of a block with a given key
+        :param key: Key to search for
+        :return: List of child ScriptNodes with the key
+        """
+        return [child for child in self.children if child.key == key]
+
+
+def parseEntries(source, start: int = 0, end: int = None):
+    """
+    Lazily parses the entries of a Paradox script, nested blocks are skipped over and only parsed when their children
+    are accessed
+    :param source: Script as a string, bytes or a memory-mapped file
+    :param start: Offset to start parsing from
+    :param end: Offset to stop parsing at, defaults to the end of the source
+    :return: Generator of ScriptNodes
+    """
+    tokens = tokenize(source, start, end)
+    pending = None
+
+    for kind, value, tokenStart, tokenEnd in tokens:
+        if kind == "operator" and pending is not None:
+            key = pending[1]
+            pending = None
+            nextToken = next(tokens, None)
+            if nextToken is None:
+                break
+            if nextToken[0] == "open":
+                yield ScriptNode(key, value, None, nextToken[2], skipBlock(tokens, tokenEnd), source)
+            elif nextToken[0] in VALUE_TOKENS:
+                yield ScriptNode(key, value, nextToken[1], nextToken[2], nextToken[3])
+            continue
+
+        if pending is not None:
+            yield ScriptNode(None, None, pending[1], pending[2], pending[3])
+            pending = None
+
+        if kind in VALUE_TOKENS:
+            pending = (kind, value, tokenStart, tokenEnd)
+        elif kind == "open":
+            yield ScriptNode(None, None, None, tokenStart, skipBlock(tokens, tokenEnd), source)
+
+    if pending is not None:
+        yield ScriptNode(None, None, pending[1], pending[2], pending[3])
+
+
+def skipBlock(tokens, blockStart: int):
+    """
+    Consumes tokens up to and including the closing brace of a block whose opening brace was just consumed
+    :param tokens: Token generator from tokenize
+    :param blockStart: Offset after the opening brace, used if the block is never closed
+    :return: Offset after the closing brace
+    """
+    depth = 1
+    end = blockStart
+    for kind, value, tokenStart, tokenEnd in tokens:
+        end = tokenEnd
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+            if depth == 0:
+                break
+    return end
+
+
+def parseScript(source):
+    """
+    Parses a Paradox script into a root block
+    :param source: Script as a string, bytes or a memory-mapped file
+    :return: ScriptNode whose children are the top level entries of the script
+    """
+    root = ScriptNode(None, None, None, -1, len(source) + 1, source)
+    root._children = list(parseEntries(source))
+    return root
+
+
+def queryScript(source, path: str):
+    """
+    Finds every value at a path of keys in a single pass over the tokens, without building any nodes
+    :param source: Script as a string, bytes or a memory-mapped file
+    :param path: Keys separated by slashes such as "focus_tree/focus/id", "*" matches any key and a path starting
+    with "**/" matches at any depth
+    :return: Generator of (value, offset) tuples for every key = value entry at the path
+    """
+    anyDepth = path.startswith("**/")
+    segments = path[3:].split("/") if anyDepth else path.split("/")
+
+    def matches(keys):
+        if len(keys) < len(segments) or (not anyDepth and len(keys) != len(segments)):
+            return False
+        return all(segment == "*" or segment == key for segment, key in zip(segments, keys[-len(segments):]))
+
+    # Keys of the blocks currently open, None for anonymous blocks
+    stack = []
+    tokens = tokenize(source)
+    pending = None
+
+    for kind, value, tokenStart, tokenEnd in tokens:
+        if kind == "operator" and pending is not None:
+            key = pending
+            pending = None
+            nextToken = next(tokens, None)
+            if nextToken is None:
+                break
+            if nextToken[0] == "open":
+                stack.append(key)
+            elif nextToken[0] in VALUE_TOKENS and matches(stack + [key]):
+                yield nextToken[1], nextToken[2]
+            continue
+
+        pending = value if kind in VALUE_TOKENS else None
+        if kind == "open":
+            stack.append(None)
+        elif kind == "close" and len(stack) > 0:
+            stack.pop()
+
+
+def findAssignments(source, keys: [str]):
+    """
+    Finds every key = value entry with one of the provided keys at any depth in a single pass over the tokens
+    :param source: Script as a string, bytes or a memory-mapped file
+    :param keys: Keys to search for (such as "id" or "name")
+    :return: Generator of (key, value) tuples in the order they appear in the script
+    """
+    keys = set(keys)
+    tokens = tokenize(source)
+    pending = None
+
+    for kind, value, tokenStart, tokenEnd in tokens:
+        if kind == "operator" and pending is not None:
+            key = pending
+            pending = None
+            nextToken = next(tokens, None)
+            if nextToken is None:
+                break
+            if key in keys and nextToken[0] in VALUE_TOKENS:
+                yield key, nextToken[1]
+            continue
+
+        pending = value if kind in VALUE_TOKENS else None
+
+
+@contextmanager
+def mapScriptFile(filePath: str):
+    """
+    Memory-maps a script file for tokenize, parseEntries and queryScript, so large files are not read into memory
+    :param filePath: Path to the script file
+    """
+    with open(filePath, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield b""
+            return
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mappedFile:
+            yield mappedFile
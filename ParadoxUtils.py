@@ -1,6 +1,19 @@
-import json
+import itertools
 import os
 import re
+from FileDiscovery import discoverFiles
+from ImageProbe import probeImageSize
+from ParadoxScript import ParadoxWriter, findAssignments, mapScriptFile
+
+# Buffer size used when streaming large generated files to disk
+WRITE_BUFFER_SIZE = 1 << 20
+
+# File extensions read as images and as paradox script
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.dds')
+TEXT_EXTENSIONS = ('.txt',)
+
+# Threads used to walk sibling subdirectories when listing files recursively
+DISCOVERY_WORKERS = 4
 
 
 def safeWriteToFile(filePath: str, content, encoding: str = "utf-8"):
@@ -18,52 +31,288 @@ def safeWriteToFile(filePath: str, content, encoding: str = "utf-8"):
         print("Write to file failed")
 
 
-def generateGFXFile(sourceDir: str, modDir: str, targetDir: str, targetFileName: str, images: [str],
-                    namePrefix: str = "GFX_"):
+def gfxFileName(sourceDir: str, modDir: str):
     """
-    Generates a GFX file for all the image files within the provided directory and saves it to a target file
+    Creates the name of the GFX file for a directory of images, from its path relative to the mod directory
+    :param sourceDir: Directory containing input images (ending with a slash)
+    :param modDir: Directory for the root of the mod (ending with a slash)
+    :return: Name of the GFX file
+    """
+    relativePath = sourceDir.replace(modDir, "").replace("/", "_").replace("\\", "_")
+    return relativePath[:-1] + ".gfx"
+
+
+def collectSprites(sourceDir: str, modDir: str, images: [str], namePrefix: str = "GFX_", probeSizes: bool = False):
+    """
+    Creates the sprite types of the image files within the provided directory
     :param sourceDir: Directory containing input images
     :param modDir: Directory for the root of the mod
-    :param targetDir: Directory to save the GFX file to
-    :param targetFileName: Name of the new GFX file
-    :param images: List of images within the input directory
+    :param images: List of image paths relative to the input directory
     :param namePrefix: Prefix to add to names of the sprite types
+    :param probeSizes: Whether to read the size of each image from its header
+    :return: List of sprite dictionaries with "name", "texturefile", "source" and "size" ((width, height) or None).
+    writeGFXFile also accepts a "frames" count for sprite strips, along with the "frameNames" of each frame
     """
-    interface = {"spriteTypes": {}}
+    textureDir = sourceDir.replace(modDir, "")
+    return [{
+        "name": namePrefix + os.path.basename(image).split('.', 1)[0],
+        "texturefile": textureDir + image,
+        "source": sourceDir + image,
+        "size": probeImageSize(sourceDir + image) if probeSizes else None,
+    } for image in images]
 
-    for i in range(0, len(images)):
-        interface["spriteTypes"].update({
-            f"spriteType{i}": {
-                "name": namePrefix + images[i].split('.', 1)[0],
-                "texturefile": sourceDir.replace(modDir, "") + images[i]
-            },
-        })
 
+def writeGFXFile(targetDir: str, targetFileName: str, sprites: [dict]):
+    """
+    Saves a GFX file containing the provided sprite types
+    :param targetDir: Directory to save the GFX file to
+    :param targetFileName: Name of the new GFX file
+    :param sprites: Sprite dictionaries from collectSprites
+    :return: True if the file was written, otherwise False
+    """
     os.makedirs(targetDir, exist_ok=True)
 
-    jsonString = json.dumps(interface, indent=4)
-    fixedJson = jsonStringToParadoxText(jsonString, "spriteType", ["spriteTypes", "spriteType", "name", "texturefile"])
-
-    safeWriteToFile(targetDir + targetFileName, fixedJson)
+    try:
+        with open(targetDir + targetFileName, 'w', encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as newFile:
+            writer = ParadoxWriter(newFile)
+            with writer.block("spriteTypes"):
+                for sprite in sprites:
+                    with writer.block("spriteType"):
+                        writer.assign("name", sprite["name"], quote=True)
+                        writer.assign("texturefile", sprite["texturefile"], quote=True)
+                        if sprite.get("frames", 1) > 1:
+                            writer.assign("noOfFrames", sprite["frames"])
+                        # Frames are numbered from 1, as used by the frame property of GUI icons
+                        for frame, frameName in enumerate(sprite.get("frameNames", []), 1):
+                            writer.comment(f"frame {frame} = {frameName}")
+                        # spriteType has no size property, so the size is only recorded for reference
+                        if sprite.get("size") is not None:
+                            writer.comment(f"size = {sprite['size'][0]}x{sprite['size'][1]}")
+        return True
+    except OSError:
+        print("Write to file failed")
+        return False
 
 
-def jsonStringToParadoxText(content: str, indexedPattern: str, removeQuotePattern: [str]):
+def generateGFXFile(sourceDir: str, modDir: str, targetDir: str, targetFileName: str, images: [str],
+                    namePrefix: str = "GFX_", includeSizes: bool = False):
     """
-    Converts a json string to a paradox compatible string
-    :param content: JSON string
-    :param indexedPattern: String that was repeated during creation of the dictionary and had an index appended to it
-    :param removeQuotePattern: String that needs to appear in the paradox file without surrounding "double quotes"
-    :return: Paradox compatible string
+    Generates a GFX file for all the image files within the provided directory and saves it to a target file
+    :param sourceDir: Directory containing input images
+    :param modDir: Directory for the root of the mod
+    :param targetDir: Directory to save the GFX file to
+    :param targetFileName: Name of the new GFX file
+    :param images: List of images within the input directory
+    :param namePrefix: Prefix to add to names of the sprite types
+    :param includeSizes: Whether to record the size of each image, read from its header
     """
-    fixedJson = re.sub(fr"{indexedPattern}\d+", indexedPattern, content)
-    fixedJson = fixedJson.replace(",", "")
-    fixedJson = fixedJson.replace(":", "=")
-    fixedJson = fixedJson[1:-1]
+    writeGFXFile(targetDir, targetFileName, collectSprites(sourceDir, modDir, images, namePrefix, includeSizes))
 
-    for pattern in removeQuotePattern:
-        fixedJson = re.sub(fr"\"{pattern}\"", pattern, fixedJson)
 
-    return fixedJson
+def buildGFXFiles(sourceDirs: [str], modDir: str, targetDir: str, namePrefix: str = "GFX_", recursive: bool = False,
+                  mergedFileName: str = None, includeSizes: bool = False, existingSprites: dict = None):
+    """
+    Generates the GFX files for every image within a list of directories in one run, either one file per folder of
+    images or a single merged file. A sprite name that was already used, or that is already defined by another GFX file
+    of the mod, is left out and reported as a duplicate
+    :param sourceDirs: Directories containing input images (ending with a slash)
+    :param modDir: Directory for the root of the mod (ending with a slash)
+    :param targetDir: Directory to save the GFX files to
+    :param namePrefix: Prefix to add to names of the sprite types
+    :param recursive: Whether to include the images of every subfolder
+    :param mergedFileName: Name of the single GFX file every sprite is written to, None for one file per folder
+    :param includeSizes: Whether to record the size of each image, read from its header
+    :param existingSprites: Optional dictionary mapping each sprite name already defined within the mod to the GFX
+    files defining it (relative to the mod root), such as ModIndex.symbolLocations("sprite"). Definitions within the
+    GFX file a sprite is written to are ignored, as that file is replaced
+    :return: Tuple of (list of written GFX file names, list of {"name", "texturefiles"} duplicate dictionaries).
+    Sprites already defined within the mod list the defining GFX files in place of their first texture file
+    """
+    # Maps each GFX file name to its sprites, in the order the folders were listed
+    files = {}
+    spriteTextures = {}
+    duplicates = {}
+
+    for sourceDir in sourceDirs:
+        images = listImageFiles(sourceDir, recursive)
+        for sprite in collectSprites(sourceDir, modDir, images, namePrefix, includeSizes):
+            if sprite["name"] in spriteTextures:
+                duplicates.setdefault(sprite["name"], [spriteTextures[sprite["name"]]]).append(sprite["texturefile"])
+                continue
+            spriteTextures[sprite["name"]] = sprite["texturefile"]
+
+            if mergedFileName is not None:
+                fileName = mergedFileName
+            else:
+                fileName = gfxFileName(os.path.dirname(sprite["source"]) + "/", modDir)
+
+            if existingSprites is not None:
+                targetPath = os.path.abspath(targetDir + fileName)
+                definedIn = [path for path in existingSprites.get(sprite["name"], [])
+                             if os.path.abspath(modDir + path) != targetPath]
+                if len(definedIn) > 0:
+                    duplicates.setdefault(sprite["name"], definedIn).append(sprite["texturefile"])
+                    continue
+            files.setdefault(fileName, []).append(sprite)
+
+    writtenFiles = [fileName for fileName, sprites in files.items() if writeGFXFile(targetDir, fileName, sprites)]
+    return writtenFiles, [{"name": name, "texturefiles": textures} for name, textures in duplicates.items()]
+
+
+# Matches the key of a localisation line such as ' my_key:0 "Text"', ignoring comments and the language header
+LOCALISATION_KEY_PATTERN_BYTES = re.compile(rb'^[ \t]*([^\s:#"]+):\d*[ \t]*"', re.MULTILINE)
+
+
+def indexLocalisationFile(filePath: str):
+    """
+    Reads the keys of an existing localisation file in a single pass
+    :param filePath: Path to the localisation file
+    :return: Set of keys within the file, empty if the file does not exist
+    """
+    try:
+        with mapScriptFile(filePath) as source:
+            keys = LOCALISATION_KEY_PATTERN_BYTES.findall(source)
+    except FileNotFoundError:
+        return set()
+    return set(key.decode("utf-8", "replace") for key in keys)
+
+
+class LocalisationBuilder:
+    def __init__(self, language: str = "english"):
+        """
+        Collects localisation keys from any number of sources into one ordered table without duplicates, which is then
+        written to disk at once
+        :param language: Language of the localisation file (such as "english")
+        """
+        self.language = language
+        # Maps each key to its (version, text), dictionaries keep keys in the order they were first added
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def removeKeys(self, keys):
+        """
+        Removes localisation keys that were added, such as keys already defined by other files of the mod
+        :param keys: Keys to remove (a set or any other collection)
+        """
+        self.entries = {key: entry for key, entry in self.entries.items() if key not in keys}
+
+    def add(self, key: str, text: str, version: str = ""):
+        """
+        Adds a localisation key, keys that were already added keep their first text
+        :param key: Localisation key
+        :param text: Localised text of the key
+        :param version: Version number written after the key's colon (such as "0"), empty for none
+        """
+        if key not in self.entries:
+            self.entries[key] = (version, text)
+
+    def addImages(self, images: [str]):
+        """
+        Adds a localisation key for each image, named after the image file without its extension
+        :param images: List of image file names
+        """
+        for image in images:
+            key = os.path.basename(image).split('.', 1)[0].lower()
+            self.add(key, key)
+
+    def addIdentifiers(self, source, identifierNames: [str] = None):
+        """
+        Adds a localisation key for every value declared using the provided identifierNames (such as "id", or "name")
+        :param source: Contents of a paradox *.txt file (a string, bytes or a memory-mapped file)
+        :param identifierNames: Identifiers to pull localisation keys from
+        """
+        if identifierNames is None:
+            identifierNames = ["id"]
+
+        # Keys are grouped by identifier so all ids come before all names within each source
+        keysByIdentifier = {currentID: [] for currentID in identifierNames}
+        for currentID, key in findAssignments(source, identifierNames):
+            keysByIdentifier[currentID].append(key)
+
+        for currentID in identifierNames:
+            for key in keysByIdentifier[currentID]:
+                self.add(key, removeUnderscoresCapitalise(key), "0" if currentID == "id" else "")
+
+    def addFolder(self, sourceDir: str, useIDs: bool = True, useImages: bool = True, useNames: bool = True,
+                  recursive: bool = False):
+        """
+        Adds localisation keys for the images and/or the identifiers within the text files of a folder
+        :param sourceDir: Input directory (ending with a slash)
+        :param useIDs: Whether to pull localisation keys from "id" identifiers
+        :param useImages: Whether to use the names of image files as localisation keys
+        :param useNames: Whether to pull localisation keys from "name" identifiers
+        :param recursive: Whether to also add the files of every subfolder
+        """
+        if useImages:
+            self.addImages(listImageFiles(sourceDir, recursive))
+
+        identifiers = []
+        identifiers.append("id") if useIDs else {}
+        identifiers.append("name") if useNames else {}
+
+        if len(identifiers) > 0:
+            for textFile in listTextFiles(sourceDir, recursive):
+                with mapScriptFile(sourceDir + textFile) as source:
+                    self.addIdentifiers(source, identifiers)
+
+    def lines(self):
+        """
+        Formats every localisation key as a line of the localisation file
+        :return: Generator of lines, starting with the language header
+        """
+        yield f"l_{self.language}:"
+        for key, (version, text) in self.entries.items():
+            yield f"\n {key}:{version} \"{text}\" "
+
+    def write(self, targetDir: str, targetFileName: str):
+        """
+        Saves the localisation file in a single buffered write
+        :param targetDir: Output directory
+        :param targetFileName: Output file name
+        :return: True if the file was written, otherwise False
+        """
+        os.makedirs(targetDir, exist_ok=True)
+        try:
+            with open(targetDir + targetFileName, 'w', encoding="utf-8-sig", buffering=WRITE_BUFFER_SIZE) as newFile:
+                newFile.writelines(self.lines())
+            return True
+        except OSError:
+            print("Write to file failed")
+            return False
+
+    def merge(self, targetDir: str, targetFileName: str):
+        """
+        Appends only the keys missing from an existing localisation file, so hand edited lines are left untouched.
+        Creates the file if it does not exist and there is at least one key
+        :param targetDir: Output directory
+        :param targetFileName: Output file name
+        :return: Tuple of (keys appended, stale keys within the file that this builder no longer provides)
+        """
+        filePath = targetDir + targetFileName
+        if not os.path.exists(filePath):
+            # Like write's callers, an empty builder does not create a file holding only the header
+            if len(self) == 0:
+                return [], []
+            return (list(self.entries) if self.write(targetDir, targetFileName) else []), []
+
+        existingKeys = indexLocalisationFile(filePath)
+        missingKeys = [key for key in self.entries if key not in existingKeys]
+        staleKeys = sorted(key for key in existingKeys if key not in self.entries)
+
+        if len(missingKeys) > 0:
+            try:
+                # Generated files end without a newline, so each appended line starts with one as in lines()
+                with open(filePath, 'a', encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as file:
+                    for key in missingKeys:
+                        version, text = self.entries[key]
+                        file.write(f"\n {key}:{version} \"{text}\" ")
+            except OSError:
+                print("Write to file failed")
+                return [], staleKeys
+
+        return missingKeys, staleKeys
 
 
 def generateLocalisationFileFromStringList(characters: [str], targetDir: str, targetFileName: str):
@@ -73,42 +322,57 @@ def generateLocalisationFileFromStringList(characters: [str], targetDir: str, ta
     :param targetDir: Output directory
     :param targetFileName: Output file name
     """
-    localisationContent = "l_english:"
+    builder = LocalisationBuilder()
+    builder.addImages(characters)
+    builder.write(targetDir, targetFileName)
 
-    for i in range(0, len(characters)):
-        characters[i] = characters[i].split('.', 1)[0]
-        localisationContent += f"\n {characters[i].lower()}: \"{characters[i].lower()}\" "
-
-    os.makedirs(targetDir, exist_ok=True)
 
-    safeWriteToFile(targetDir + targetFileName, localisationContent, "utf-8-sig")
-
-
-def generateLocalisationFileFromIdentifiers(sourceFile: str, targetDir: str, targetFileName: str,
+def generateLocalisationFileFromIdentifiers(sourceFile, targetDir: str, targetFileName: str,
                                             identifierNames: [str] = None):
     """
     Generates and saves an english localisation file that provides localisation for keys declared using the provided
     identifierNames (such as "id", or "name")
-    :param sourceFile: Input directory of paradox *.txt files
+    :param sourceFile: Contents of a paradox *.txt file (a string, bytes or a memory-mapped file)
     :param targetDir: Output directory
     :param targetFileName: Output file name
     :param identifierNames: Identifiers to pull localisation keys from
     """
-    if identifierNames is None:
-        identifierNames = ["id"]
+    builder = LocalisationBuilder()
+    builder.addIdentifiers(sourceFile, identifierNames)
+    if len(builder) > 0:
+        builder.write(targetDir, targetFileName)
 
-    localisationContent = "l_english:"
-    for currentID in identifierNames:
-        pattern = fr'{currentID}\s*=\s*([^\n\r]*)'
 
-        ids = re.findall(pattern, sourceFile)
+def generateLocalisationFromFolder(sourceDir: str, targetDir: str, targetFileName: str, useIDs: bool = True,
+                                   useImages: bool = True, useNames: bool = True, merge: bool = False,
+                                   recursive: bool = False, existingKeys: set = None):
+    """
+    Generates and saves an english localisation file for the images and/or the identifiers within the text files of a
+    folder, every source of the folder is combined into the one file
+    :param sourceDir: Input directory (ending with a slash)
+    :param targetDir: Output directory
+    :param targetFileName: Output file name
+    :param useIDs: Whether to pull localisation keys from "id" identifiers
+    :param useImages: Whether to use the names of image files as localisation keys
+    :param useNames: Whether to pull localisation keys from "name" identifiers
+    :param merge: Whether to only append missing keys to an existing file instead of rewriting it
+    :param recursive: Whether to also use the files of every subfolder
+    :param existingKeys: Optional set of localisation keys already defined by other files of the mod (such as from
+    ModIndex.symbolLocations("localisation")), which are left out
+    :return: Tuple of (number of localisation keys written, stale keys within an existing file when merging)
+    """
+    builder = LocalisationBuilder()
+    builder.addFolder(sourceDir, useIDs, useImages, useNames, recursive)
+    if existingKeys is not None:
+        builder.removeKeys(existingKeys)
 
-        for i in range(0, len(ids)):
-            localisationContent += f"\n {ids[i]}:{'0' if currentID == 'id' else ''} \"{removeUnderscoresCapitalise(ids[i])}\" "
+    if merge:
+        addedKeys, staleKeys = builder.merge(targetDir, targetFileName)
+        return len(addedKeys), staleKeys
 
-    if localisationContent != "l_english:":
-        os.makedirs(targetDir, exist_ok=True)
-        safeWriteToFile(targetDir + targetFileName, localisationContent, "utf-8-sig")
+    if len(builder) > 0 or useImages:
+        builder.write(targetDir, targetFileName)
+    return len(builder), []
 
 
 def removeUnderscoresCapitalise(s: str):
@@ -139,87 +403,166 @@ def removeUnderscoresCapitalise(s: str):
     return ''.join(chars)
 
 
-def generateGenericCharacters(characters: [str], targetDir: str, targetFileName: str,
-                              namePrefix: str = "GEN_", gfxPrefix: str = "GFX_"):
+def shardFileName(targetFileName: str, shard: int):
+    """
+    Gets the file name of a shard of a generated file, the first shard keeps the original name
+    :param targetFileName: Name of the generated file
+    :param shard: Index of the shard, starting from 0
+    :return: File name of the shard, such as "characters_2.txt" for the second shard of "characters.txt"
+    """
+    if shard == 0:
+        return targetFileName
+    name, extension = os.path.splitext(targetFileName)
+    return f"{name}_{shard + 1}{extension}"
+
+
+def shardMarker(targetFileName: str, shard: int):
+    """
+    Gets the comment written on the first line of every later shard, marking it as written by generateGenericCharacters
+    :param targetFileName: Name of the generated file
+    :param shard: Index of the shard, starting from 1
+    :return: Text of the comment
     """
-    Generates and saves a file of generic characters, created from a list of input strings
-    :param characters: List of names of the characters (used for name= and for other values with prefixes)
+    return f"Shard {shard + 1} of {targetFileName}, generated by HOI4 Utility Tool"
+
+
+def isGeneratedShard(filePath: str, targetFileName: str, shard: int):
+    """
+    Checks whether a file is a shard previously written by generateGenericCharacters, from its first line
+    :param filePath: Path to the file
+    :param targetFileName: Name of the generated file
+    :param shard: Index of the shard, starting from 1
+    :return: True if the file starts with the shard's marker comment
+    """
+    try:
+        with open(filePath, 'r', encoding="utf-8") as file:
+            return file.readline().rstrip("\r\n") == "# " + shardMarker(targetFileName, shard)
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def generateGenericCharacters(characters, targetDir: str, targetFileName: str, namePrefix: str = "GEN_",
+                              gfxPrefix: str = "GFX_", charactersPerFile: int = None):
+    """
+    Generates and saves a file of generic characters, created from input strings. Characters are written as they are
+    read, so any iterable (including a generator) can be used without holding the roster in memory
+    :param characters: Iterable of names of the characters (used for name= and for other values with prefixes), image
+    file names and paths are reduced to the file name without its extension
     :param targetDir: Output directory
     :param targetFileName: Output file name
     :param namePrefix: Prefix used for the token_base
     :param gfxPrefix: Prefix used for references to GFX sprite types
+    :param charactersPerFile: Number of characters written to each file before starting the next shard (named
+    "<name>_2.txt", "<name>_3.txt"...), None or 0 writes every character to the one file
+    :return: List of written file paths
     """
-    everyCountry = {"every_possible_country": {}}
-    everyCountry["every_possible_country"].update({"limit": {}})
-
-    for i in range(0, len(characters)):
-        characters[i] = characters[i].split('.', 1)[0]
-
-    for i in range(0, len(characters)):
-        everyCountry["every_possible_country"].update({
-            f"generate_character{i}": {
-                "token_base": namePrefix + characters[i].lower(),
-                "name": characters[i].lower(),
-                "portraits": {
-                    "army": {
-                        "large": gfxPrefix + characters[i].lower()
-                    },
-                    "civilian": {
-                        "large": gfxPrefix + characters[i].lower(),
-                        "small": gfxPrefix + "small_" + characters[i].lower(),
-                    },
-                    "navy": {
-                        "large": gfxPrefix + characters[i].lower(),
-                    }
-                },
-                "advisor": {
-                    "slot": "political_advisor",
-                    "traits": {
-                    }
-                },
-            }
-        })
+    if charactersPerFile is not None and (not isinstance(charactersPerFile, int) or isinstance(charactersPerFile, bool)
+                                          or charactersPerFile < 0):
+        raise ValueError(f"Characters per file must be a whole number, not {charactersPerFile!r}")
+    charactersPerFile = charactersPerFile or None
 
     os.makedirs(targetDir, exist_ok=True)
+    characters = iter(characters)
+    writtenFiles = []
 
-    jsonString = json.dumps(everyCountry, indent=4)
-    fixedJson = jsonStringToParadoxText(jsonString, "generate_character", [])
-    fixedJson = fixedJson.replace("\"", "")
+    try:
+        for shard in itertools.count():
+            shardCharacters = characters if charactersPerFile is None else \
+                itertools.islice(characters, charactersPerFile)
+            firstCharacter = next(shardCharacters, None)
+            if firstCharacter is None and shard > 0:
+                break
+
+            filePath = targetDir + shardFileName(targetFileName, shard)
+            with open(filePath, 'w', encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as newFile:
+                writer = ParadoxWriter(newFile)
+                if shard > 0:
+                    writer.comment(shardMarker(targetFileName, shard))
+                with writer.block("every_possible_country"):
+                    writer.emptyBlock("limit")
+
+                    if firstCharacter is not None:
+                        for character in itertools.chain([firstCharacter], shardCharacters):
+                            character = os.path.basename(character).split('.', 1)[0].lower()
+                            writeGenericCharacter(writer, character, namePrefix, gfxPrefix)
+            writtenFiles.append(filePath)
+
+            if charactersPerFile is None:
+                break
+    except OSError:
+        print("Write to file failed")
+        return writtenFiles
 
-    safeWriteToFile(targetDir + targetFileName, fixedJson)
+    # Remove shards left over from a previous, larger roster, leaving any file this tool did not write
+    shard = len(writtenFiles)
+    while isGeneratedShard(targetDir + shardFileName(targetFileName, shard), targetFileName, shard):
+        os.remove(targetDir + shardFileName(targetFileName, shard))
+        shard += 1
 
+    return writtenFiles
 
-def addSharedFocusToEveryTree(inputDir: str, sharedFocus: str):
+
+def writeGenericCharacter(writer: ParadoxWriter, character: str, namePrefix: str, gfxPrefix: str):
+    """
+    Writes a single generate_character block
+    :param writer: Writer of the generic character file
+    :param character: Name of the character
+    :param namePrefix: Prefix used for the token_base
+    :param gfxPrefix: Prefix used for references to GFX sprite types
     """
-    Adds a shared focus to every focus tree in the provided directory
+    with writer.block("generate_character"):
+        writer.assign("token_base", namePrefix + character, quote=False)
+        writer.assign("name", character, quote=False)
+
+        with writer.block("portraits"):
+            with writer.block("army"):
+                writer.assign("large", gfxPrefix + character, quote=False)
+            with writer.block("civilian"):
+                writer.assign("large", gfxPrefix + character, quote=False)
+                writer.assign("small", gfxPrefix + "small_" + character, quote=False)
+            with writer.block("navy"):
+                writer.assign("large", gfxPrefix + character, quote=False)
+
+        with writer.block("advisor"):
+            writer.assign("slot", "political_advisor")
+            writer.emptyBlock("traits")
+
+
+def addSharedFocusToEveryTree(inputDir: str, sharedFocus: str, dryRun: bool = False, recursive: bool = False):
+    """
+    Adds a shared focus to every focus tree in the provided directory, skipping trees that already have it
     :param inputDir: Input directory
     :param sharedFocus: Name of the (first) shared focus to add to every tree
+    :param dryRun: Whether to only create the diffs without changing any file
+    :param recursive: Whether to also edit the focus trees of every subfolder
+    :return: List of (file path, status, unified diff) tuples, see FocusTreeEditor.editFocusTree
     """
-    focusTrees = listTextFiles(inputDir)
-
-    for currentTree in focusTrees:
-        with open(inputDir + currentTree, "r+", encoding="utf-8") as file:
-            oldTree = file.read()
-            print(oldTree)
-            pattern = r"(focus_tree\s*=\s*\{)"
+    from FocusTreeEditor import addSharedFocus, editFocusTrees
 
-            if re.search(pattern, oldTree):
-                newTree = re.sub(pattern, r"\1" + "shared_focus = " + sharedFocus, oldTree, count=1)
-                file.seek(0)
-                file.write(newTree)
-                file.truncate()
+    return editFocusTrees(inputDir, [addSharedFocus(sharedFocus)], dryRun, recursive)
 
 
-def listTextFiles(directory):
+def listTextFiles(directory, recursive: bool = False, include: [str] = None, exclude: [str] = None):
     """
     List text files in a specified directory
     :param directory: The directory to search for text files
-    :return: A list of text file names in the directory
+    :param recursive: Whether to also search every subdirectory
+    :param include: Glob patterns a file must match to be listed (such as "*_focus.txt")
+    :param exclude: Glob patterns of files and subdirectories to leave out
+    :return: A list of text file paths relative to the directory, sorted by path
     """
-    # List all files in the directory
-    allFiles = os.listdir(directory)
+    return [f.path for f in discoverFiles(directory, TEXT_EXTENSIONS, recursive, include, exclude,
+                                          workers=DISCOVERY_WORKERS)]
 
-    # Filter for text files
-    textFiles = [f for f in allFiles if f.lower().endswith('.txt')]
-    return textFiles
 
+def listImageFiles(directory, recursive: bool = False, include: [str] = None, exclude: [str] = None):
+    """
+    List image files in a specified directory
+    :param directory: The directory to search for image files
+    :param recursive: Whether to also search every subdirectory
+    :param include: Glob patterns a file must match to be listed (such as "GEN_*")
+    :param exclude: Glob patterns of files and subdirectories to leave out
+    :return: A list of image file paths relative to the directory, sorted by path
+    """
+    return [f.path for f in discoverFiles(directory, IMAGE_EXTENSIONS, recursive, include, exclude,
+                                          workers=DISCOVERY_WORKERS)]
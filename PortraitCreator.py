@@ -1,93 +1,279 @@
-from PIL import Image, ImageFilter
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
 import cv2
 import numpy as np
 import pypdn
+from BuildManifest import BuildManifest
+from ImageWriter import ImageWriter
 
+LEADER_BACKGROUND_PATH = "Assets/Leader Background.png"
+ADVISOR_FRAME_PATH = "Assets/Minister Base.png"
 
-def transformImage(image: Image, corners: []):
+# Compare and swap steps that move the median of 9 values to index 4
+MEDIAN_NETWORK = [(1, 2), (4, 5), (7, 8), (0, 1), (3, 4), (6, 7), (1, 2), (4, 5), (7, 8), (0, 3), (5, 8), (4, 7),
+                  (3, 6), (1, 4), (2, 5), (4, 7), (4, 2), (6, 4), (4, 2)]
+
+# Largest number of portraits generated together as one stack of arrays, bounding the memory of each batch
+MAX_BATCH_SIZE = 32
+
+
+class FrameAsset:
+    def __init__(self, path: str, modifiedTime: int):
+        """
+        Decodes a frame asset and precomputes the arrays derived from it
+        :param path: Path to the asset image
+        :param modifiedTime: Modification time (in nanoseconds) of the asset when it was decoded
+        """
+        self.path = path
+        self.modifiedTime = modifiedTime
+
+        self.image = Image.open(path)
+        self.image.load()
+        self.array = np.array(self.image)
+        self.alphaMask = createMaskFromAlpha(self.array)
+
+        # Cached arrays are shared between every portrait, so guard them against accidental in-place edits
+        self.array.flags.writeable = False
+        self.alphaMask.flags.writeable = False
+
+
+_frameAssets = {}
+
+
+def loadFrameAsset(path: str):
     """
-    Transforms an image so its four corners match the provided four corners
-    :param image: Image to transform
-    :param corners: Corners to transform the image to
-    :return: Transformed image
+    Returns the decoded frame asset at a path, only decoding it again if the file has been modified since it was cached
+    :param path: Path to the asset image
+    :return: Cached FrameAsset for the path
     """
-    # Define the transformation matrix using four corners
-    sourceCorners = np.float32([[0, 0], [image.shape[1], 0], [0, image.shape[0]], [image.shape[1], image.shape[0]]])
-    transformationMatrix = cv2.getPerspectiveTransform(sourceCorners, corners)
+    key = os.path.abspath(path)
+    modifiedTime = os.stat(key).st_mtime_ns
 
-    # Determine the dimensions of the transformed image
-    transformedCorners = cv2.perspectiveTransform(np.array([sourceCorners]), transformationMatrix)[0]
-    max_x, max_y = np.max(transformedCorners, axis=0)
-    width, height = int(max_x), int(max_y)
+    asset = _frameAssets.get(key)
+    if asset is None or asset.modifiedTime != modifiedTime:
+        asset = FrameAsset(key, modifiedTime)
+        _frameAssets[key] = asset
+    return asset
 
-    # Create an output image with an alpha channel
-    outputImage = np.zeros((67, 65, 4), dtype=np.uint8)
 
-    # Apply the transformation and set alpha values
-    outputImage[:, :, 3] = 0  # Set alpha channel to fully transparent within the transformed region
-
-    transformed = cv2.warpPerspective(image, transformationMatrix, (width, height))
-    outputImage[:transformed.shape[0], :transformed.shape[1], :3] = transformed
-    outputImage[:transformed.shape[0], :transformed.shape[1], 3] = 255
-    return outputImage
+def clearFrameAssetCache():
+    """
+    Removes every cached frame asset, forcing them to be decoded again on next use
+    """
+    _frameAssets.clear()
+
+
+class PortraitTemplate:
+    def __init__(self, framePath: str, corners: [[float]], size: (int, int), offset: (int, int) = (0, 0)):
+        """
+        Describes how a portrait is warped into a frame asset
+        :param framePath: Path to the frame asset drawn over the warped portrait
+        :param corners: Target corners of the portrait (top left, top right, bottom left, bottom right)
+        :param size: Width and height of the output image
+        :param offset: Position of the warped portrait within the output image
+        """
+        self.framePath = framePath
+        self.corners = np.float32(corners)
+        self.size = size
+        self.offset = offset
+        self._warpMaps = {}
+
+    def compileWarp(self, sourceShape: tuple):
+        """
+        Compiles the remap grids and coverage mask used to warp images of a given shape, compiled grids are cached
+        :param sourceShape: Shape of the images that will be warped
+        :return: Tuple of (x map, y map, coverage mask)
+        """
+        sourceSize = (sourceShape[1], sourceShape[0])
+        if sourceSize in self._warpMaps:
+            return self._warpMaps[sourceSize]
+
+        # Define the transformation matrix using four corners
+        sourceCorners = np.float32([[0, 0], [sourceSize[0], 0], [0, sourceSize[1]], [sourceSize[0], sourceSize[1]]])
+        transformationMatrix = cv2.getPerspectiveTransform(sourceCorners, self.corners)
+
+        # Determine the dimensions of the transformed image
+        transformedCorners = cv2.perspectiveTransform(np.array([sourceCorners]), transformationMatrix)[0]
+        maxX, maxY = np.max(transformedCorners, axis=0)
+        outputWidth, outputHeight = self.size
+        width = max(0, min(int(maxX), outputWidth - self.offset[0]))
+        height = max(0, min(int(maxY), outputHeight - self.offset[1]))
+
+        # Map every output pixel back to the source image, pixels outside the warped region sample the border instead
+        inverseMatrix = cv2.invert(transformationMatrix)[1]
+        y, x = np.mgrid[0:outputHeight, 0:outputWidth].astype(np.float64)
+        x -= self.offset[0]
+        y -= self.offset[1]
+        w = inverseMatrix[2, 0] * x + inverseMatrix[2, 1] * y + inverseMatrix[2, 2]
+        mapX = ((inverseMatrix[0, 0] * x + inverseMatrix[0, 1] * y + inverseMatrix[0, 2]) / w).astype(np.float32)
+        mapY = ((inverseMatrix[1, 0] * x + inverseMatrix[1, 1] * y + inverseMatrix[1, 2]) / w).astype(np.float32)
+
+        coverage = np.zeros((outputHeight, outputWidth), dtype=np.uint8)
+        coverage[self.offset[1]:self.offset[1] + height, self.offset[0]:self.offset[0] + width] = 255
+        mapX[coverage == 0] = -sourceSize[0]
+        mapY[coverage == 0] = -sourceSize[1]
+
+        self._warpMaps[sourceSize] = (mapX, mapY, coverage)
+        return self._warpMaps[sourceSize]
+
+
+# Templates are compiled on first use for each source size, new frame styles only need an entry here
+PORTRAIT_TEMPLATES = {
+    "advisor": PortraitTemplate(ADVISOR_FRAME_PATH, [[5, 8], [40, 5], [9, 57], [44, 54]], (65, 67)),
+}
+
+
+def transformImage(image: np.array, template: PortraitTemplate):
+    """
+    Transforms an image so its four corners match the corners of a portrait template
+    :param image: Image to transform
+    :param template: Template describing the target corners and output size
+    :return: Transformed RGBA image, transparent outside the transformed region
+    """
+    return warpImages(image[None], template)[0]
 
 
-def createMaskFromAlpha(image: np.array):
+def warpImages(images: np.array, template: PortraitTemplate):
+    """
+    Transforms a stack of same-size images so their four corners match the corners of a portrait template, sampling
+    every image at once with bilinear interpolation and a black border (matching cv2.remap with INTER_LINEAR)
+    :param images: Stack of uint8 images (count x height x width x channels)
+    :param template: Template describing the target corners and output size
+    :return: Stack of transformed RGBA images, transparent outside the transformed region
+    """
+    mapX, mapY, coverage = template.compileWarp(images.shape[1:])
+    height, width = images.shape[1:3]
+
+    left = np.floor(mapX)
+    top = np.floor(mapY)
+    fractionX = (mapX - left)[:, :, None]
+    fractionY = (mapY - top)[:, :, None]
+    left = left.astype(np.intp)
+    top = top.astype(np.intp)
+
+    def sample(offsetY: int, offsetX: int):
+        x = left + offsetX
+        y = top + offsetY
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        values = images[:, y.clip(0, height - 1), x.clip(0, width - 1), :3].astype(np.float32)
+        values *= inside[:, :, None]
+        return values
+
+    # Interpolate along each row and then between the rows, in the same order as OpenCV
+    upper = sample(0, 0)
+    upper += (sample(0, 1) - upper) * fractionX
+    lower = sample(1, 0)
+    lower += (sample(1, 1) - lower) * fractionX
+    upper += (lower - upper) * fractionY
+
+    outputImages = np.empty((len(images),) + coverage.shape + (4,), dtype=np.uint8)
+    np.rint(upper, out=upper)
+    outputImages[..., :3] = upper
+    outputImages[..., 3] = coverage
+    return outputImages
+
+
+def createMaskFromAlpha(image: np.array, out: np.array = None):
     """
     Creates a mask using the alpha values of Image pixels
     :param image: Image to create a mask from
+    :param out: Optional preallocated uint8 array (height x width) to write the mask into
     :return: An image mask
     """
-    mask = np.full((image.shape[0], image.shape[1]), 0, dtype=np.uint8)
-    for x in range(image.shape[0]):
-        for y in range(image.shape[1]):
-            # Using index 3 causes a runtime error if the provided image is not RGBA,
-            # if this causes a crash, set every pixel to 0
-            try:
-                mask[x, y] = 255 - image[x, y, 3]
-            except:
-                mask[x, y] = 0
-    return mask
+    if out is None:
+        out = np.empty((image.shape[0], image.shape[1]), dtype=np.uint8)
+
+    # Images without an alpha channel (RGB, greyscale) have nothing to mask, so every pixel is set to 0
+    if image.ndim != 3 or image.shape[2] < 4:
+        out.fill(0)
+        return out
+
+    np.subtract(255, image[:, :, 3], out=out, casting="unsafe")
+    return out
 
 
-def createMaskFromBlack(image: np.array):
+def createMaskFromBlack(image: np.array, out: np.array = None):
     """
-    Creates an image mask from black areas of an image
+    Creates an image mask from black areas of an image, any pixel with a zero value channel is masked out
     :param image: Image to create a mask from
+    :param out: Optional preallocated uint8 array (height x width) to write the mask into
     :return: An image mask
     """
-    mask = np.full((image.shape[0], image.shape[1]), 255, dtype=np.uint8)
-    for x in range(image.shape[0]):
-        for y in range(image.shape[1]):
-            if image[x, y].all() == 0:
-                mask[x, y] = 0
-    return mask
+    if out is None:
+        out = np.empty((image.shape[0], image.shape[1]), dtype=np.uint8)
 
+    opaque = np.all(image, axis=2) if image.ndim == 3 else image != 0
+    np.multiply(opaque, 255, out=out, casting="unsafe")
+    return out
 
-def addMask(originalMask: np.array, newMask: np.array):
+
+def addMask(originalMask: np.array, newMask: np.array, out: np.array = None):
     """
     Combines two image masks, masks out pixels in originalMask if their corresponding pixel in newMask is masked out
     :param originalMask: Mask to update
     :param newMask: Mask to add to the original mask
+    :param out: Optional array to write the combined mask into, defaults to updating originalMask in place
     :return: Updated mask
     """
-    for x in range(originalMask.shape[0]):
-        for y in range(originalMask.shape[1]):
-            if newMask[x, y].all() == 0:
-                originalMask[x, y] = 0
-    return originalMask
+    # Find the masked out pixels first, as out is allowed to be the newMask buffer
+    maskedOut = ~np.all(newMask, axis=2) if newMask.ndim == 3 else newMask == 0
+
+    if out is None:
+        out = originalMask
+    elif out is not originalMask:
+        np.copyto(out, originalMask)
 
+    out[maskedOut] = 0
+    return out
 
-def invertMask(mask: np.array):
+
+def invertMask(mask: np.array, out: np.array = None):
     """
     Inverts a mask matrix, setting each pixel to: 255 - currentPixel
     :param mask: Mask matrix
+    :param out: Optional array to write the inverted mask into, defaults to inverting mask in place
     :return: Inverted mask matrix
     """
-    for x in range(mask.shape[0]):
-        for y in range(mask.shape[1]):
-            mask[x, y] = 255 - mask[x, y]
-    return mask
+    if out is None:
+        out = mask
+    np.subtract(255, mask, out=out, casting="unsafe")
+    return out
+
+
+class SourceImage:
+    def __init__(self, image: Image):
+        """
+        A character image normalised to RGBA, along with the downscaled copies made from it. Each output generated from
+        the same character reuses the one decoded image
+        :param image: Decoded image of the character
+        """
+        self.image = image if image.mode == "RGBA" else image.convert("RGBA")
+        self._downscaled = {}
+
+    @staticmethod
+    def open(path: str):
+        """
+        Decodes a character image file, closing the file once it is decoded
+        :param path: Path to the image
+        :return: SourceImage of the file
+        """
+        with Image.open(path) as image:
+            image.load()
+            return SourceImage(image.convert("RGBA"))
+
+    def downscaled(self, targetX: int):
+        """
+        Downscales the image to a target width, each width is only downscaled once
+        :param targetX: Target X length in pixels
+        :return: Tuple of (downscaled image, array of the downscaled image)
+        """
+        if targetX not in self._downscaled:
+            downscaledImage = targetXDownscale(self.image, targetX)
+            self._downscaled[targetX] = (downscaledImage, np.asarray(downscaledImage))
+        return self._downscaled[targetX]
 
 
 def targetXDownscale(image: Image, targetX: int):
@@ -102,86 +288,615 @@ def targetXDownscale(image: Image, targetX: int):
     return image2
 
 
-def generateAdvisorPortrait(inputImage: Image):
+def generateAdvisorPortrait(inputImage: Image, templateName: str = "advisor"):
     """
     Generates an advisor portrait for a given input image
-    :param inputImage: Image to transform into the frame of the advisor portrait
+    :param inputImage: Image (or array of the image) to transform into the frame of the advisor portrait
+    :param templateName: Name of the portrait template (within PORTRAIT_TEMPLATES) to use
     :return: The input image transformed inside the advisor portrait
     """
-    portraitBase = Image.open("Assets/Minister Base.png")
-    inputImageArray = np.array(inputImage)
-    targetCorners = np.float32([[5, 8], [40, 5], [9, 57], [44, 54]])
-    inputImageTransformed = Image.fromarray(transformImage(inputImageArray, targetCorners))
+    inputArray = inputImage if isinstance(inputImage, np.ndarray) else np.asarray(inputImage)
+    return Image.fromarray(generateAdvisorPortraits(inputArray[None], templateName)[0])
+
+
+def generateAdvisorPortraits(portraits: np.array, templateName: str = "advisor"):
+    """
+    Generates the advisor portraits of a stack of same-size portraits at once
+    :param portraits: Stack of uint8 RGB or RGBA portraits (count x height x width x channels)
+    :param templateName: Name of the portrait template (within PORTRAIT_TEMPLATES) to use
+    :return: Stack of uint8 RGBA advisor portraits
+    """
+    template = PORTRAIT_TEMPLATES[templateName]
+    portraitBase = loadFrameAsset(template.framePath)
+    transformed = warpImages(portraits, template)
+
+    # The frame covers its own opaque pixels, along with any pixel of the portrait with a zero channel
+    frameMask = np.where(np.all(transformed, axis=3), 255 - portraitBase.alphaMask, 255).astype(np.uint16)
+    return blendImages(transformed, portraitBase.array, frameMask[..., None])
+
+
+def blendImages(destination: np.array, source: np.array, mask: np.array):
+    """
+    Blends a source image over destination images through a mask, matching Image.paste with a mask
+    :param destination: uint8 images to blend onto, or a stack of them
+    :param source: uint8 image with the same channels as the destination
+    :param mask: Amount (0-255) of the source shown at each pixel, broadcastable against the images
+    :return: Blended uint8 images
+    """
+    mask = mask.astype(np.uint16)
+    return divide255(destination * (255 - mask) + source * mask).astype(np.uint8)
 
-    inputMask = createMaskFromBlack(np.array(inputImageTransformed))
-    portraitMask = createMaskFromAlpha(np.array(portraitBase))
-    collatedMasks = addMask(portraitMask, inputMask)
-    collatedMasks = invertMask(collatedMasks)
 
-    inputImageTransformed.paste(portraitBase, (0, 0), Image.fromarray(collatedMasks))
-    return inputImageTransformed
+def stackCharacters(sources: [SourceImage], targetX: int, height: int, width: int):
+    """
+    Downscales character images to a target width and stacks them at the top left of same-size transparent images
+    :param sources: SourceImages of the characters
+    :param targetX: Width each character is downscaled to
+    :param height: Height of every image in the stack, taller characters are cropped
+    :param width: Width of every image in the stack, wider characters are cropped
+    :return: Stack of uint8 RGBA images (count x height x width x 4)
+    """
+    characters = np.zeros((len(sources), height, width, 4), dtype=np.uint8)
+    for i, source in enumerate(sources):
+        downscaledArray = source.downscaled(targetX)[1][:height, :width]
+        characters[i, :downscaledArray.shape[0], :downscaledArray.shape[1]] = downscaledArray
+    return characters
+
+
+def medianFilterImages(images: np.array):
+    """
+    Applies a 3x3 median filter to each channel of a stack of images, repeating the edge pixels (matching
+    ImageFilter.MedianFilter(3))
+    :param images: Stack of uint8 images (count x height x width x channels)
+    :return: Stack of filtered images
+    """
+    height, width = images.shape[1:3]
+    padded = np.pad(images, ((0, 0), (1, 1), (1, 1), (0, 0)), mode="edge")
+    neighbours = [padded[:, y:y + height, x:x + width] for y in range(3) for x in range(3)]
+
+    # Partially sort the 9 neighbours with a sorting network, leaving the median in the middle
+    for first, second in MEDIAN_NETWORK:
+        neighbours[first], neighbours[second] = np.minimum(neighbours[first], neighbours[second]), \
+            np.maximum(neighbours[first], neighbours[second])
+    return neighbours[4]
+
+
+def sharpenImages(images: np.array):
+    """
+    Sharpens each channel of a stack of images, leaving the edge pixels unchanged (matching ImageFilter.SHARPEN)
+    :param images: Stack of uint8 images (count x height x width x channels)
+    :return: Stack of sharpened images
+    """
+    height, width = images.shape[1:3]
+    values = images.astype(np.int32)
+    neighbourhoodSum = sum(values[:, y:y + height - 2, x:x + width - 2] for y in range(3) for x in range(3))
+
+    # The kernel is 32 at the centre and -2 for each neighbour, divided by 16 and rounded
+    sharpened = images.copy()
+    sharpened[:, 1:-1, 1:-1] = np.clip((34 * values[:, 1:-1, 1:-1] - 2 * neighbourhoodSum + 8) // 16, 0, 255)
+    return sharpened
 
 
 def createPortrait(inputImage: Image, filterImage: bool = True):
     """
     Takes an image of a character without a background, de-noises and sharpens the image
     and places the image over a HOI4 character portrait background
-    :param inputImage: Image of the character to place on a HOI4 leader background
+    :param inputImage: Image (or SourceImage) of the character to place on a HOI4 leader background
     :param filterImage: If true, image is filtered
     :return: 156x210 character portrait image
     """
-    inputImage = targetXDownscale(inputImage, 156)
-    leaderMask = createMaskFromAlpha(np.array(inputImage))
-    leaderMask = invertMask(leaderMask)
-    portraitBase = Image.open("Assets/Leader Background.png")
-    portraitBase.paste(inputImage, (0, 0), Image.fromarray(leaderMask))
+    source = inputImage if isinstance(inputImage, SourceImage) else SourceImage(inputImage)
+    return Image.fromarray(createPortraits([source], filterImage)[0])
+
+
+def createPortraits(sources: [SourceImage], filterImages: bool = True):
+    """
+    Places a batch of character images over the HOI4 character portrait background at once, optionally de-noising and
+    sharpening them
+    :param sources: SourceImages of the characters
+    :param filterImages: If true, the portraits are filtered
+    :return: Stack of uint8 portraits (count x 210 x 156 x channels of the background)
+    """
+    background = loadFrameAsset(LEADER_BACKGROUND_PATH).array
+    characters = stackCharacters(sources, 156, background.shape[0], background.shape[1])
 
-    if filterImage:
-        portraitBase = portraitBase.filter(ImageFilter.MedianFilter(3))
-        portraitBase = portraitBase.filter(ImageFilter.SHARPEN())
+    # Each character is shown over the background through its own alpha
+    portraits = blendImages(background, characters[..., :background.shape[2]], characters[..., 3:])
 
-    return portraitBase
+    if filterImages:
+        portraits = sharpenImages(medianFilterImages(portraits))
 
+    return portraits
 
-def generatePortraits(sourceDir: str, folder: [str], filterImages: bool, outputDir: str, genAdvisors: bool = True):
+
+def renderPortraits(sourceDir: str, images: [str], filterImages: bool, outputDir: str, genAdvisors: bool = True,
+                    focusFrames: [(str, str, str)] = None, extension: str = None):
+    """
+    Creates the portraits (and optionally the advisor portraits and focus icons) for a batch of image files in memory.
+    Each image is decoded once, and the portraits and advisor portraits of the batch are created together
+    :param sourceDir: Input folder path
+    :param images: Paths of the images relative to the input folder
+    :param filterImages: Whether to apply a median filter and sharpen to the input images
+    :param outputDir: Output folder path
+    :param genAdvisors: Whether to generate advisor portraits from the input images additionally
+    :param focusFrames: Optional list of (PDN focus frame path, output folder path, name prefix) tuples, a focus icon is
+    generated for each
+    :param extension: Extension of the output files (such as ".dds"), None keeps the extension of each image
+    :return: List with a tuple of (list of (output path, image) tuples in the order of portraitOutputPaths, error
+    message or None) for each image
+    """
+    results = [([], None)] * len(images)
+    sources = {}
+    for i in range(0, len(images)):
+        try:
+            sources[i] = SourceImage.open(sourceDir + images[i])
+        except Exception:
+            results[i] = ([], traceback.format_exc())
+
+    if len(sources) == 0:
+        return results
+
+    try:
+        portraits = createPortraits(list(sources.values()), filterImages)
+        advisors = generateAdvisorPortraits(portraits) if genAdvisors else None
+    except Exception:
+        error = traceback.format_exc()
+        return [([], error) if i in sources else results[i] for i in range(0, len(images))]
+
+    for j, (i, source) in enumerate(sources.items()):
+        try:
+            outputImages = [Image.fromarray(portraits[j])]
+            if genAdvisors:
+                outputImages.append(Image.fromarray(advisors[j]))
+            for pdnFramePath, iconDir, namePrefix in focusFrames or []:
+                outputImages.append(generateFocusIcon(source, pdnFramePath))
+
+            results[i] = (list(zip(portraitOutputPaths(outputDir, images[i], genAdvisors, focusFrames, extension),
+                                   outputImages)), None)
+        except Exception:
+            results[i] = ([], traceback.format_exc())
+
+    return results
+
+
+def generatePortrait(sourceDir: str, image: str, filterImages: bool, outputDir: str, genAdvisors: bool = True,
+                     focusFrames: [(str, str, str)] = None, extension: str = None, writer: ImageWriter = None):
+    """
+    Generates and writes the portrait (and optionally the advisor portrait and focus icons) for a single image file
+    :param sourceDir: Input folder path
+    :param image: Path of the image relative to the input folder
+    :param filterImages: Whether to apply a median filter and sharpen to the input image
+    :param outputDir: Output folder path
+    :param genAdvisors: Whether to generate an advisor portrait from the input image additionally
+    :param focusFrames: Optional list of (PDN focus frame path, output folder path, name prefix) tuples, a focus icon is
+    generated for each
+    :param extension: Extension of the output files (such as ".dds"), None keeps the extension of the image
+    :param writer: Optional ImageWriter whose PNG settings are used and timings added to, the images are still written
+    before returning
+    :return: Tuple of (image name, list of written output paths, error message or None)
+    """
+    return generatePortraitBatch(sourceDir, [image], filterImages, outputDir, genAdvisors, focusFrames, extension,
+                                 writer)[0]
+
+
+def generatePortraitBatch(sourceDir: str, images: [str], filterImages: bool, outputDir: str, genAdvisors: bool = True,
+                          focusFrames: [(str, str, str)] = None, extension: str = None, writer: ImageWriter = None):
+    """
+    Generates and writes the portraits (and optionally the advisor portraits and focus icons) for a batch of image
+    files, with arguments as described in generatePortrait
+    :param images: Paths of the images relative to the input folder
+    :return: List of (image name, list of written output paths, error message or None) tuples in the same order
+    """
+    if writer is None:
+        writer = ImageWriter(workers=1)
+
+    startTime = time.perf_counter()
+    rendered = renderPortraits(sourceDir, images, filterImages, outputDir, genAdvisors, focusFrames, extension)
+    writer.record(computeSeconds=time.perf_counter() - startTime)
+
+    results = []
+    for image, (outputs, error) in zip(images, rendered):
+        outputPaths = []
+        try:
+            for outputPath, outputImage in outputs:
+                writer.write(outputImage, outputPath)
+                outputPaths.append(outputPath)
+        except Exception:
+            error = traceback.format_exc()
+        results.append((image, outputPaths, error))
+
+    return results
+
+
+def _generatePortraitTask(task: tuple):
+    """
+    Unpacks a generatePortraitBatch call for a process pool worker
+    :param task: Arguments to generatePortraitBatch followed by the PNG compression level, optimize and mipmaps settings
+    :return: Tuple of (result of generatePortraitBatch, seconds generating, seconds encoding)
+    """
+    *arguments, compressLevel, optimize, mipmaps = task
+    writer = ImageWriter(workers=1, compressLevel=compressLevel, optimize=optimize, mipmaps=mipmaps)
+    results = generatePortraitBatch(*arguments, writer=writer)
+    return results, writer.computeSeconds, writer.encodeSeconds
+
+
+def writeErrors(futures: list):
+    """
+    Gets the errors of finished ImageWriter futures
+    :param futures: Futures from ImageWriter.submit
+    :return: Formatted traceback of the first failed write, or None if every write succeeded
+    """
+    for future in futures:
+        error = future.exception()
+        if error is not None:
+            return "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    return None
+
+
+def portraitOutputPaths(outputDir: str, image: str, genAdvisors: bool = True, focusFrames: [(str, str, str)] = None,
+                        extension: str = None):
+    """
+    Gets the paths of the files generatePortrait writes for an image
+    :param outputDir: Output folder path
+    :param image: Name of the image within the input folder
+    :param genAdvisors: Whether an advisor portrait is generated additionally
+    :param focusFrames: Optional list of (PDN focus frame path, output folder path, name prefix) tuples
+    :param extension: Extension of the output files (such as ".dds"), None keeps the extension of the image
+    :return: List of output paths, the portrait followed by the advisor portrait and each focus icon
+    """
+    return [prefixedOutputPath(outputDir, image, "", extension)] + \
+        ([prefixedOutputPath(outputDir, image, "small_", extension)] if genAdvisors else []) + \
+        [prefixedOutputPath(iconDir, image, namePrefix, extension)
+         for pdnFramePath, iconDir, namePrefix in focusFrames or []]
+
+
+def prefixedOutputPath(outputDir: str, image: str, prefix: str = "", extension: str = None):
+    """
+    Gets the output path of an image, images within subfolders of the input folder keep the same subfolders
+    :param outputDir: Output folder path
+    :param image: Path of the image relative to the input folder
+    :param prefix: Prefix added to the file name
+    :param extension: Extension of the output file (such as ".dds"), None keeps the extension of the image
+    :return: Output path
+    """
+    subfolder, name = os.path.split(image)
+    if extension is not None:
+        name = os.path.splitext(name)[0] + extension
+    return outputDir + (subfolder + "/" if subfolder != "" else "") + prefix + name
+
+
+def generatePortraits(sourceDir: str, folder: [str], filterImages: bool, outputDir: str, genAdvisors: bool = True,
+                      workers: int = 1, chunkSize: int = None, progress=None, incremental: bool = False,
+                      focusFrames: [(str, str, str)] = None, extension: str = None, writer: ImageWriter = None):
     """
     Generates portraits from a list of image files in a source directory
     :param sourceDir: Input folder path
-    :param folder: List of images within the input folder
+    :param folder: List of image paths relative to the input folder
     :param filterImages: Whether to apply a median filter and sharpen to the input images
     :param outputDir: Output folder path
     :param genAdvisors: Whether to generate advisor portraits from the input images additionally
+    :param workers: Number of worker processes, 1 generates every portrait in this process and None uses every core
+    :param chunkSize: Number of images generated together as one batch (sent to a worker at a time), from 1 to
+    MAX_BATCH_SIZE. Defaults to spreading each worker over 4 chunks
+    :param progress: Optional callable taking (images done, total images), called after each image. Any exception it
+    raises stops the remaining images from being generated
+    :param incremental: If true, images whose outputs are unchanged since the last build (according to the build
+    manifest in the output folder) are skipped, and outputs of images no longer in the folder are deleted
+    :param focusFrames: Optional list of (PDN focus frame path, output folder path, name prefix) tuples, a focus icon is
+    generated for each from the same decode of every image as its portraits
+    :param extension: Extension of the output files, ".dds" writes BC3 compressed textures. None keeps the extension
+    of each image
+    :param writer: Optional ImageWriter setting the PNG and DDS options and collecting the timings of the run. With
+    one worker the images are written on its threads while the next batch is generated, worker processes write their
+    own images
+    :return: List of (image name, output paths, error message or None) tuples in the same order as folder
+    """
+    manifest = BuildManifest(outputDir) if incremental else None
+    assetPaths = [LEADER_BACKGROUND_PATH] + ([PORTRAIT_TEMPLATES["advisor"].framePath] if genAdvisors else []) + \
+        [pdnFramePath for pdnFramePath, iconDir, namePrefix in focusFrames or []]
+    parameters = {"generator": "portraits", "filter": filterImages, "advisors": genAdvisors, "template": "advisor"}
+    if focusFrames:
+        parameters["focusIconPrefixes"] = [namePrefix for pdnFramePath, iconDir, namePrefix in focusFrames]
+
+    ownsWriter = writer is None
+    if ownsWriter:
+        writer = ImageWriter()
+    parameters.update(textureParameters(extension, writer))
+
+    results = [None] * len(folder)
+    keys = [None] * len(folder)
+    taskIndices = []
+    for i in range(0, len(folder)):
+        if manifest is not None:
+            keys[i] = itemKeyOrNone(manifest, [sourceDir + folder[i]] + assetPaths, parameters)
+            outputPaths = portraitOutputPaths(outputDir, folder[i], genAdvisors, focusFrames, extension)
+            if keys[i] is not None and manifest.isFresh(outputPaths, keys[i]):
+                results[i] = (folder[i], outputPaths, None)
+                continue
+        taskIndices.append(i)
+
+    done = len(folder) - len(taskIndices)
+    writer.record(imagesSkipped=done)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(taskIndices)))
+    if chunkSize is None:
+        chunkSize = max(1, len(taskIndices) // (workers * 4))
+    chunkSize = max(1, min(chunkSize, MAX_BATCH_SIZE))
+
+    batches = [taskIndices[start:start + chunkSize] for start in range(0, len(taskIndices), chunkSize)]
+    tasks = [(sourceDir, [folder[i] for i in batch], filterImages, outputDir, genAdvisors, focusFrames, extension)
+             for batch in batches]
+
+    def recordResult(i: int, result: tuple):
+        results[i] = result
+        if manifest is not None and result[2] is None and keys[i] is not None:
+            manifest.record("portraits", sourceDir + folder[i], result[1], keys[i], sourceDir)
+
+    # Images submitted to the writer, as (index, output paths, futures), only recorded once they are written
+    pendingWrites = []
+
+    def finishWrites():
+        writer.flush()
+        for i, outputPaths, futures in pendingWrites:
+            recordResult(i, (folder[i], outputPaths, writeErrors(futures)))
+        pendingWrites.clear()
+
+    # Executor.map yields results in submission order, so output order does not depend on worker scheduling
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            for batch, task in zip(batches, tasks):
+                startTime = time.perf_counter()
+                rendered = renderPortraits(*task)
+                writer.record(computeSeconds=time.perf_counter() - startTime)
+
+                for i, (outputs, error) in zip(batch, rendered):
+                    if error is not None:
+                        recordResult(i, (folder[i], [], error))
+                    else:
+                        pendingWrites.append((i, [outputPath for outputPath, outputImage in outputs],
+                                              [writer.submit(outputImage, outputPath) for outputPath, outputImage in
+                                               outputs]))
+
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(folder))
+        else:
+            processTasks = [task + (writer.compressLevel, writer.optimize, writer.mipmaps) for task in tasks]
+            taskResults = executor.map(_generatePortraitTask, processTasks)
+
+            for batch, (batchResults, computeSeconds, encodeSeconds) in zip(batches, taskResults):
+                writer.record(computeSeconds, encodeSeconds, sum(len(result[1]) for result in batchResults))
+                for i, result in zip(batch, batchResults):
+                    recordResult(i, result)
+
+                    done += 1
+                    if progress is not None:
+                        progress(done, len(folder))
+    except BaseException:
+        # Drop any chunks that have not started yet rather than waiting for the whole batch
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        # Save even if the batch was stopped, so finished portraits are not generated again
+        finishWrites()
+        if ownsWriter:
+            writer.close()
+        if manifest is not None:
+            manifest.save()
+
+    if executor is not None:
+        executor.shutdown()
+
+    if manifest is not None:
+        manifest.removeOrphans("portraits", sourceDir, [outputPath for f in folder
+                                                        for outputPath in portraitOutputPaths(outputDir, f,
+                                                                                              genAdvisors,
+                                                                                              focusFrames,
+                                                                                              extension)])
+        manifest.save()
+
+    return results
+
+
+def textureParameters(extension: str, writer: ImageWriter):
+    """
+    Gets the build manifest parameters of the output format, empty for outputs that keep the extension of each image
+    so manifests from before DDS output stay valid
+    :param extension: Extension of the output files, None keeps the extension of each image
+    :param writer: ImageWriter writing the outputs
+    :return: Dictionary of parameters
     """
-    for f in folder:
-        currentImage = Image.open(sourceDir + f)
-        largePortrait = createPortrait(currentImage, filterImages)
+    if extension is None:
+        return {}
+    if extension.lower() == ".dds":
+        return {"extension": extension, "mipmaps": writer.mipmaps}
+    return {"extension": extension}
 
-        largeImagePath = outputDir + f
-        largePortrait.save(largeImagePath)
 
-        if genAdvisors:
-            smallImagePath = outputDir + "small_" + f
-            generateAdvisorPortrait(largePortrait).save(smallImagePath)
+def itemKeyOrNone(manifest: BuildManifest, sourcePaths: [str], parameters: dict):
+    """
+    Creates the build manifest key of an item, returning None if any of its source files cannot be read
+    :param manifest: Build manifest of the output folder
+    :param sourcePaths: Source image followed by any frame assets used to generate the item
+    :param parameters: Generation parameters
+    :return: Key of the item, or None
+    """
+    try:
+        return manifest.itemKey(sourcePaths, parameters)
+    except OSError:
+        return None
+
+
+def divide255(values: np.array):
+    """
+    Divides a uint16 array by 255 with rounding, using only integer shifts and additions
+    :param values: uint16 array with values no larger than 255 * 255
+    :return: values / 255 rounded to the nearest integer
+    """
+    values = values + 128
+    return (values + (values >> 8)) >> 8
+
+
+def premultiplyImage(image: np.array, opacity=255):
+    """
+    Converts straight RGB/RGBA uint8 images to premultiplied RGBA, applying a layer opacity to the alpha channel
+    :param image: uint8 image, or a stack of uint8 images
+    :param opacity: Opacity (0-255) of the image, or an array of opacities broadcastable against the alpha channel
+    :return: Premultiplied uint8 RGBA image(s)
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8:
+        image = image.astype(np.uint8)
+
+    premultiplied = np.empty(image.shape[:-1] + (4,), dtype=np.uint8)
+    if image.shape[-1] == 3:
+        alpha = np.full(image.shape[:-1], 255, dtype=np.uint16)
+    else:
+        alpha = image[..., 3].astype(np.uint16)
+
+    alpha = divide255(alpha * np.asarray(opacity, dtype=np.uint16))
+    premultiplied[..., 3] = alpha
+    premultiplied[..., :3] = divide255(image[..., :3] * alpha[..., None])
+    return premultiplied
+
+
+def compositeNormal(destination: np.array, source: np.array, out: np.array = None):
+    """
+    Composites a premultiplied image over another using the Normal blend mode
+    :param destination: Premultiplied uint8 RGBA image to composite onto
+    :param source: Premultiplied uint8 RGBA image to place over the destination
+    :param out: Optional array to write the result into, may be the destination itself
+    :return: Premultiplied uint8 RGBA result
+    """
+    if out is None:
+        out = np.empty_like(destination)
+
+    transparency = 255 - source[..., 3:].astype(np.uint16)
+    np.add(source, divide255(destination * transparency), out=out, casting="unsafe")
+    return out
+
+
+def unpremultiplyImage(image: np.array, out: np.array = None):
+    """
+    Converts a premultiplied RGBA uint8 image back to straight RGBA
+    :param image: Premultiplied uint8 RGBA image
+    :param out: Optional array to write the result into, may be the image itself
+    :return: Straight uint8 RGBA image
+    """
+    if out is None:
+        out = np.empty_like(image)
+
+    alpha = image[..., 3:].astype(np.uint16)
+    colour = (image[..., :3] * np.uint16(255) + (alpha >> 1)) // np.maximum(alpha, 1)
+    np.minimum(colour, 255, out=out[..., :3], casting="unsafe")
+    out[..., 3:] = alpha
+    return out
+
+
+def flattenLayers(layers: [pypdn.Layer], width: int, height: int):
+    """
+    Flattens a stack of layers using the Normal blend mode, respecting each layer's opacity and visibility
+    :param layers: Layers to flatten, ordered from bottom to top
+    :param width: Width of the flattened image
+    :param height: Height of the flattened image
+    :return: Flattened uint8 RGBA image
+    """
+    visibleLayers = [layer for layer in layers if layer.visible]
+    for layer in visibleLayers:
+        if layer.blendMode != pypdn.BlendType.Normal:
+            raise ValueError(f"Layer \"{layer.name}\" uses the unsupported {layer.blendMode.name} blend mode")
+
+    flattenedImage = np.zeros((height, width, 4), dtype=np.uint8)
+    if len(visibleLayers) == 0:
+        return flattenedImage
+
+    # Premultiply every layer in one pass over the stacked images, then composite them from the bottom up
+    opacities = np.array([layer.opacity for layer in visibleLayers], dtype=np.uint16).reshape(-1, 1, 1)
+    layerStack = premultiplyImage(np.stack([np.asarray(layer.image) for layer in visibleLayers]), opacities)
+    for layerImage in layerStack:
+        compositeNormal(flattenedImage, layerImage, out=flattenedImage)
+
+    return unpremultiplyImage(flattenedImage, out=flattenedImage)
+
+
+class FocusFrame:
+    def __init__(self, path: str, modifiedTime: int):
+        """
+        Parses a PDN focus frame and precomposites the plates below and above the character insert point (the top
+        layer of the frame)
+        :param path: Path to the PDN focus icon frame
+        :param modifiedTime: Modification time (in nanoseconds) of the frame when it was parsed
+        """
+        self.path = path
+        self.modifiedTime = modifiedTime
+
+        layeredImage = pypdn.read(path)
+        self.width = layeredImage.width
+        self.height = layeredImage.height
+
+        # Flatten every layer beneath the top layer once, characters are only ever composited on top of this plate
+        belowLayers = layeredImage.layers[:-1]
+        if all(layer.blendMode == pypdn.BlendType.Normal for layer in belowLayers if layer.visible):
+            belowPlate = flattenLayers(belowLayers, self.width, self.height)
+        else:
+            # Frames using other blend modes are flattened with pypdn, this only happens once per frame
+            belowImage = pypdn.LayeredImage(self.width, self.height, layeredImage.version)
+            for layer in belowLayers:
+                layer.image = np.array(layer.image).astype(np.float32)
+                belowImage.layers.append(layer)
+            belowPlate = belowImage.flatten(asByte=True) if len(belowLayers) > 0 else \
+                np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        self.belowPlate = premultiplyImage(belowPlate)
+
+        topLayer = layeredImage.layers[-1]
+        if topLayer.visible and topLayer.blendMode != pypdn.BlendType.Normal:
+            raise ValueError(f"The top layer of {path} must use the Normal blend mode")
+        self.abovePlate = premultiplyImage(topLayer.image, topLayer.opacity if topLayer.visible else 0)
+
+        # The flattened frame is used to mask out the bottom half of characters
+        flattenedFrame = unpremultiplyImage(compositeNormal(self.belowPlate, self.abovePlate))
+        self.maskImage = Image.fromarray(flattenedFrame)
+
+        self.belowPlate.flags.writeable = False
+        self.abovePlate.flags.writeable = False
+
+
+_focusFrames = {}
+
+
+def loadFocusFrame(pdnFramePath: str):
+    """
+    Returns the parsed focus frame at a path, only parsing it again if the file has been modified since it was cached
+    :param pdnFramePath: Path to the PDN focus icon frame
+    :return: Cached FocusFrame for the path
+    """
+    key = os.path.abspath(pdnFramePath)
+    modifiedTime = os.stat(key).st_mtime_ns
+
+    frame = _focusFrames.get(key)
+    if frame is None or frame.modifiedTime != modifiedTime:
+        frame = FocusFrame(key, modifiedTime)
+        _focusFrames[key] = frame
+    return frame
 
 
 def generateFocusIcon(baseImage: Image, pdnFramePath: str):
     """
     Places the bottom half of a HOI4 character image below the top layer of a PDN file and the top half above the
     top layer
-    :param baseImage: Image to place within the focus icon
+    :param baseImage: Image (or SourceImage) to place within the focus icon
     :param pdnFramePath: Path to the PDN focus icon frame
     :return: Flattened image with the baseImage layered beneath and above the frame
     """
-    # Open PDN image and downscale/convert the image of the character
-    layeredImage = pypdn.read(pdnFramePath)
-    characterImage = targetXDownscale(baseImage.convert("RGBA"), 65)
+    # Fetch the preflattened PDN frame and downscale/convert the image of the character
+    frame = loadFocusFrame(pdnFramePath)
+    source = baseImage if isinstance(baseImage, SourceImage) else SourceImage(baseImage)
+    characterImage, characterArray = source.downscaled(65)
 
-    # Convert the image to a numpy array before flattening
-    for layer in layeredImage.layers:
-        layer.image = np.array(layer.image).astype(np.float32)
-    maskImage = Image.fromarray(np.array(layeredImage.flatten(asByte=True)))
-
-    layerBottom = Image.new("RGBA", (100, 88), (0, 0, 0, 0))
+    layerBottom = Image.new("RGBA", (frame.width, frame.height), (0, 0, 0, 0))
     layerTop = layerBottom.copy()
 
     # Crop the top half of the input image and place it within the topHalf image
@@ -192,34 +907,82 @@ def generateFocusIcon(baseImage: Image, pdnFramePath: str):
     bottomHalf = characterImage.crop((0, characterImage.height // 2, characterImage.width, characterImage.height))
     bottomHalfFull = layerBottom.copy()
     bottomHalfFull.paste(bottomHalf, (19, 40), bottomHalf)
-    layerBottom.paste(bottomHalfFull, (0, 0), maskImage)
-
-    # Create new PDN layers from the top and bottom half images
-    pdBottomLayer = pypdn.Layer(
-        name="",
-        image=layerBottom,
-        opacity=255,
-        blendMode=pypdn.BlendType.Normal,
-        visible=True,
-        isBackground=False,
-    )
-    pdTopLayer = pypdn.Layer(
-        name="",
-        image=layerTop,
-        opacity=255,
-        blendMode=pypdn.BlendType.Normal,
-        visible=True,
-        isBackground=False,
-    )
-
-    # Place the PDN layers into the PDN focus frame
-    layeredImage.layers.insert(len(layeredImage.layers) - 1, pdBottomLayer)
-    layeredImage.layers.append(pdTopLayer)
-
-    # Convert the image to a numpy array before flattening
-    for layer in layeredImage.layers:
-        layer.image = np.array(layer.image).astype(np.float32)
-    flattenedImage = layeredImage.flatten(asByte=True)
+    layerBottom.paste(bottomHalfFull, (0, 0), frame.maskImage)
+
+    # Composite the bottom half, the top layer of the frame and then the top half onto the below plate
+    flattenedImage = compositeNormal(frame.belowPlate, premultiplyImage(np.array(layerBottom)))
+    compositeNormal(flattenedImage, frame.abovePlate, out=flattenedImage)
+    compositeNormal(flattenedImage, premultiplyImage(np.array(layerTop)), out=flattenedImage)
 
     # Return the flattened image
-    return Image.fromarray(np.array(flattenedImage))
+    return Image.fromarray(unpremultiplyImage(flattenedImage, out=flattenedImage))
+
+
+def generateFocusIcons(sourceDir: str, folder: [str], pdnFramePath: str, outputDir: str, namePrefix: str = "GEN_",
+                       progress=None, incremental: bool = False, writer: ImageWriter = None, extension: str = None):
+    """
+    Generates focus icons from a list of image files in a source directory
+    :param sourceDir: Input folder path
+    :param folder: List of image paths relative to the input folder
+    :param pdnFramePath: Path to the PDN focus icon frame
+    :param outputDir: Output folder path
+    :param namePrefix: Prefix added to the file names of the focus icons
+    :param progress: Optional callable taking (images done, total images), called after each image. Any exception it
+    raises stops the remaining images from being generated
+    :param incremental: If true, images whose icons are unchanged since the last build (according to the build
+    manifest in the output folder) are skipped, and icons of images no longer in the folder are deleted
+    :param writer: Optional ImageWriter setting the PNG and DDS options and collecting the timings of the run, icons
+    are written on its threads while the next icon is generated
+    :param extension: Extension of the icons, ".dds" writes BC3 compressed textures. None keeps the extension of each
+    image
+    :return: List of output paths
+    """
+    manifest = BuildManifest(outputDir) if incremental else None
+    parameters = {"generator": "focusIcons", "prefix": namePrefix}
+
+    ownsWriter = writer is None
+    if ownsWriter:
+        writer = ImageWriter()
+    parameters.update(textureParameters(extension, writer))
+
+    outputPaths = []
+    # Icons submitted to the writer, as (source path, icon path, key, future), only recorded once they are written
+    pendingWrites = []
+    try:
+        for i in range(0, len(folder)):
+            iconPath = prefixedOutputPath(outputDir, folder[i], namePrefix, extension)
+            outputPaths.append(iconPath)
+
+            key = None
+            if manifest is not None:
+                key = itemKeyOrNone(manifest, [sourceDir + folder[i], pdnFramePath], parameters)
+
+            if key is not None and manifest.isFresh([iconPath], key):
+                writer.record(imagesSkipped=1)
+            else:
+                startTime = time.perf_counter()
+                icon = generateFocusIcon(SourceImage.open(sourceDir + folder[i]), pdnFramePath)
+                writer.record(computeSeconds=time.perf_counter() - startTime)
+                pendingWrites.append((sourceDir + folder[i], iconPath, key, writer.submit(icon, iconPath)))
+
+            if progress is not None:
+                progress(i + 1, len(folder))
+    finally:
+        writer.flush()
+        if ownsWriter:
+            writer.close()
+        if manifest is not None:
+            for sourcePath, iconPath, key, future in pendingWrites:
+                if key is not None and future.exception() is None:
+                    manifest.record("focusIcons", sourcePath, [iconPath], key, sourceDir)
+            manifest.save()
+
+    # Raise the first write error, once every written icon has been recorded
+    for sourcePath, iconPath, key, future in pendingWrites:
+        future.result()
+
+    if manifest is not None:
+        manifest.removeOrphans("focusIcons", sourceDir, outputPaths)
+        manifest.save()
+
+    return outputPaths
@@ -0,0 +1,174 @@
+import os
+from PIL import Image
+from BuildManifest import BuildManifest
+from ImageProbe import probeImageSize
+from ImageWriter import ImageWriter
+from ParadoxUtils import writeGFXFile
+
+# Widest sheet written, larger textures are not supported by every GPU the game runs on
+MAX_SHEET_WIDTH = 8192
+
+# Images larger than this in either dimension are left out of atlases, as they gain little from packing
+MAX_FRAME_SIZE = 256
+
+
+class SpriteSheet:
+    def __init__(self, fileName: str, frameSize: (int, int), frames: [str]):
+        """
+        A horizontal strip of same-size images, laid out as the frames of one sprite
+        :param fileName: File name of the sheet within the output folder
+        :param frameSize: (width, height) of each frame
+        :param frames: Paths of the images in each frame, relative to the input folder
+        """
+        self.fileName = fileName
+        self.frameSize = frameSize
+        self.frames = frames
+
+    def __repr__(self):
+        return f"SpriteSheet({self.fileName!r}, {self.frameSize}, {len(self.frames)} frames)"
+
+
+def groupImagesBySize(sourceDir: str, images: [str], maxFrameSize: int = MAX_FRAME_SIZE):
+    """
+    Groups images by their size, read from their headers
+    :param sourceDir: Input folder path
+    :param images: List of image paths relative to the input folder
+    :param maxFrameSize: Largest width or height of an image that is packed
+    :return: Tuple of (dictionary mapping each (width, height) to its images in order, list of images left out)
+    """
+    groups = {}
+    skipped = []
+    for image in images:
+        size = probeImageSize(sourceDir + image)
+        if size is None:
+            try:
+                with Image.open(sourceDir + image) as opened:
+                    size = opened.size
+            except OSError:
+                skipped.append(image)
+                continue
+
+        if size[0] > maxFrameSize or size[1] > maxFrameSize:
+            skipped.append(image)
+            continue
+        groups.setdefault(size, []).append(image)
+    return groups, skipped
+
+
+def planSpriteSheets(groups: dict, sheetName: str = "atlas", framesPerSheet: int = 64, extension: str = ".png"):
+    """
+    Splits groups of same-size images into sheets
+    :param groups: Dictionary mapping each (width, height) to its images, from groupImagesBySize
+    :param sheetName: Name each sheet's file name starts with
+    :param framesPerSheet: Largest number of frames within a sheet, lowered for wide images to fit MAX_SHEET_WIDTH
+    :param extension: Extension of the sheets, ".dds" writes BC3 compressed textures
+    :return: List of SpriteSheets
+    """
+    sheets = []
+    for (width, height), images in groups.items():
+        sheetFrames = max(1, min(framesPerSheet, MAX_SHEET_WIDTH // width))
+        for sheet, start in enumerate(range(0, len(images), sheetFrames)):
+            sheets.append(SpriteSheet(f"{sheetName}_{width}x{height}_{sheet + 1}{extension}", (width, height),
+                                      images[start:start + sheetFrames]))
+    return sheets
+
+
+def renderSpriteSheet(sourceDir: str, sheet: SpriteSheet):
+    """
+    Pastes the frames of a sheet side by side
+    :param sourceDir: Input folder path
+    :param sheet: SpriteSheet to render
+    :return: RGBA image of the sheet
+    """
+    width, height = sheet.frameSize
+    sheetImage = Image.new("RGBA", (width * len(sheet.frames), height), (0, 0, 0, 0))
+    for i, frame in enumerate(sheet.frames):
+        with Image.open(sourceDir + frame) as frameImage:
+            sheetImage.paste(frameImage.convert("RGBA"), (i * width, 0))
+    return sheetImage
+
+
+def packSpriteSheets(sourceDir: str, images: [str], outputDir: str, sheetName: str = "atlas",
+                     framesPerSheet: int = 64, extension: str = ".png", writer: ImageWriter = None):
+    """
+    Packs same-size small images (such as advisor portraits or focus icons) into horizontal strip sheets, so many
+    sprites load from a few textures. The written sheets are recorded in the build manifest of the output folder, and
+    sheets written by an earlier run that are no longer part of the atlas are deleted
+    :param sourceDir: Input folder path
+    :param images: List of image paths relative to the input folder
+    :param outputDir: Folder the sheets are written to
+    :param sheetName: Name each sheet's file name starts with
+    :param framesPerSheet: Largest number of frames within a sheet
+    :param extension: Extension of the sheets, ".dds" writes BC3 compressed textures
+    :param writer: Optional ImageWriter setting the PNG and DDS options, sheets are written on its threads
+    :return: Tuple of (list of written SpriteSheets, list of images left out for being too large or unreadable)
+    """
+    groups, skipped = groupImagesBySize(sourceDir, images)
+    sheets = planSpriteSheets(groups, sheetName, framesPerSheet, extension)
+
+    ownsWriter = writer is None
+    if ownsWriter:
+        writer = ImageWriter()
+    try:
+        futures = [writer.submit(renderSpriteSheet(sourceDir, sheet), outputDir + sheet.fileName) for sheet in sheets]
+        for future in futures:
+            future.result()
+    finally:
+        if ownsWriter:
+            writer.close()
+
+    # Sheets are recorded per sheet name, so atlases with other names in the same folder are left alone
+    generator = "atlas/" + sheetName
+    sheetPaths = [outputDir + sheet.fileName for sheet in sheets]
+    manifest = BuildManifest(outputDir)
+    for sheet, sheetPath in zip(sheets, sheetPaths):
+        manifest.record(generator, sourceDir, [sheetPath],
+                        manifest.itemKey([], {"frameSize": sheet.frameSize, "frames": sheet.frames}), sourceDir)
+    manifest.removeOrphans(generator, sourceDir, sheetPaths)
+    manifest.save()
+
+    return sheets, skipped
+
+
+def atlasSprites(sheets: [SpriteSheet], outputDir: str, modDir: str, namePrefix: str = "GFX_"):
+    """
+    Creates the sprite types of packed sheets, one sprite with a frame for each image
+    :param sheets: SpriteSheets from packSpriteSheets
+    :param outputDir: Folder the sheets were written to, within the mod
+    :param modDir: Directory for the root of the mod
+    :param namePrefix: Prefix to add to names of the sprite types
+    :return: List of sprite dictionaries for writeGFXFile
+    """
+    textureDir = outputDir.replace(modDir, "")
+    return [{
+        "name": namePrefix + os.path.splitext(sheet.fileName)[0],
+        "texturefile": textureDir + sheet.fileName,
+        "source": outputDir + sheet.fileName,
+        "size": (sheet.frameSize[0] * len(sheet.frames), sheet.frameSize[1]),
+        "frames": len(sheet.frames),
+        "frameNames": [os.path.splitext(os.path.basename(frame))[0] for frame in sheet.frames],
+    } for sheet in sheets]
+
+
+def buildSpriteAtlas(sourceDir: str, images: [str], outputDir: str, modDir: str, gfxDir: str, gfxFileName: str,
+                     namePrefix: str = "GFX_", sheetName: str = "atlas", framesPerSheet: int = 64,
+                     extension: str = ".png", writer: ImageWriter = None):
+    """
+    Packs same-size small images into strip sheets and writes a GFX file with a multi-frame sprite for each sheet.
+    The frame of each image is recorded next to its sprite, for GUI elements that select a frame
+    :param sourceDir: Input folder path
+    :param images: List of image paths relative to the input folder
+    :param outputDir: Folder within the mod the sheets are written to
+    :param modDir: Directory for the root of the mod
+    :param gfxDir: Directory to save the GFX file to
+    :param gfxFileName: Name of the GFX file
+    :param namePrefix: Prefix to add to names of the sprite types
+    :param sheetName: Name each sheet's file name starts with
+    :param framesPerSheet: Largest number of frames within a sheet
+    :param extension: Extension of the sheets, ".dds" writes BC3 compressed textures
+    :param writer: Optional ImageWriter setting the PNG and DDS options
+    :return: Tuple of (list of written SpriteSheets, list of images left out for being too large or unreadable)
+    """
+    sheets, skipped = packSpriteSheets(sourceDir, images, outputDir, sheetName, framesPerSheet, extension, writer)
+    writeGFXFile(gfxDir, gfxFileName, atlasSprites(sheets, outputDir, modDir, namePrefix))
+    return sheets, skipped
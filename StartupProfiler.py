@@ -0,0 +1,73 @@
+import builtins
+import sys
+import threading
+import time
+
+
+class ImportProfiler:
+    def __init__(self):
+        """
+        Records how long each top level module takes to import, including the modules it imports itself
+        """
+        self.importTimes = {}
+        self.enabled = False
+        self._originalImport = builtins.__import__
+        self._depth = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        """
+        Start timing imports
+        """
+        self.enabled = True
+        builtins.__import__ = self._timedImport
+
+    def uninstall(self):
+        """
+        Stop timing imports by restoring the original import function, called once the startup report is printed so
+        imports from job threads are not counted. enabled stays set, so lazy imports still report their own time
+        """
+        if builtins.__import__ == self._timedImport:
+            builtins.__import__ = self._originalImport
+
+    def record(self, name: str, seconds: float):
+        """
+        Record the import time of a module that was imported outside of the import hook (such as lazy imports)
+        :param name: Name of the module
+        :param seconds: Time taken to import the module
+        """
+        if self.enabled:
+            with self._lock:
+                self.importTimes[name] = self.importTimes.get(name, 0.0) + seconds
+
+    def _timedImport(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """
+        Replacement for builtins.__import__ that times the first import of each module
+        """
+        # Only outermost imports are timed, their cost already includes every nested import
+        if self._depth > 0 or level != 0 or name in sys.modules:
+            return self._originalImport(name, globals, locals, fromlist, level)
+
+        self._depth += 1
+        startTime = time.perf_counter()
+        try:
+            return self._originalImport(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.record(name, time.perf_counter() - startTime)
+
+    def report(self, timeToWindow: float):
+        """
+        Create a report of the time taken to show the window and the import cost of each module
+        :param timeToWindow: Seconds from startup until the window was shown
+        :return: The report as a string
+        """
+        lines = [f"Time to window: {timeToWindow:.3f}s", "Import costs:"]
+        with self._lock:
+            importTimes = dict(self.importTimes)
+        for name, seconds in sorted(importTimes.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"    {name:<24} {seconds:.3f}s")
+        return "\n".join(lines)
+
+
+importProfiler = ImportProfiler()
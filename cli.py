@@ -0,0 +1,431 @@
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+
+from ParadoxUtils import buildGFXFiles, generateGenericCharacters, generateLocalisationFromFolder, listImageFiles
+
+# Keys of each job type that hold paths, these are resolved relative to the manifest file
+PATH_KEYS = ["input", "output", "modRoot", "frame", "focusOutput", "gfxOutput"]
+
+
+class ManifestError(Exception):
+    """
+    Raised when a job manifest is malformed
+    """
+
+
+def loadManifest(manifestPath: str):
+    """
+    Loads a job manifest from a JSON or TOML file, resolving every path relative to the manifest
+    :param manifestPath: Path to the manifest file
+    :return: List of job dictionaries
+    """
+    with open(manifestPath, "rb") as file:
+        if manifestPath.lower().endswith(".toml"):
+            import tomllib
+            manifest = tomllib.load(file)
+        else:
+            manifest = json.load(file)
+
+    jobs = manifest.get("jobs") if isinstance(manifest, dict) else None
+    if not isinstance(jobs, list):
+        raise ManifestError("Manifest must contain a list of jobs")
+
+    manifestDir = os.path.dirname(os.path.abspath(manifestPath))
+    for i in range(0, len(jobs)):
+        if not isinstance(jobs[i], dict) or jobs[i].get("type") not in JOB_RUNNERS:
+            raise ManifestError(f"Job {i} must have a type of: {', '.join(JOB_RUNNERS)}")
+
+        for key in PATH_KEYS:
+            if key in jobs[i]:
+                if not isinstance(jobs[i][key], str):
+                    raise ManifestError(f"Job {i} \"{key}\" must be a path string")
+                jobs[i][key] = os.path.join(manifestDir, os.path.expanduser(jobs[i][key]))
+
+    return jobs
+
+
+def directoryPath(job: dict, key: str):
+    """
+    Gets a directory from a job, checking it exists
+    :param job: Job dictionary
+    :param key: Key of the directory within the job
+    :return: Directory path ending with a slash
+    """
+    if key not in job:
+        raise ManifestError(f"{job['type']} jobs require \"{key}\"")
+    if not os.path.isdir(job[key]):
+        raise FileNotFoundError(f"{key} directory does not exist: {job[key]}")
+    return os.path.join(job[key], "").replace("\\", "/")
+
+
+def modSymbolLocations(modPath: str, kind: str):
+    """
+    Brings the mod index up to date and gets every file each symbol of a kind appears in, so generators can look up
+    existing symbols without rescanning the mod
+    :param modPath: Directory for the root of the mod (ending with a slash)
+    :param kind: Kind of symbol (such as "sprite" or "localisation")
+    :return: Dictionary mapping each symbol name to a list of file paths relative to the mod root
+    """
+    from ModIndex import ModIndex
+
+    with ModIndex(modPath) as index:
+        index.refresh(None)
+        return index.symbolLocations(kind)
+
+
+def runGFXJob(job: dict):
+    """
+    Generates the GFX files for a directory of images, one per folder unless "fileName" is set
+    :param job: Job dictionary with "input", "modRoot", "output" and optionally "prefix", "fileName", "recursive",
+    "sizes" and "checkExisting" (leaving out sprites already defined by other GFX files of the mod, found with the mod
+    index)
+    :return: Tuple of (output paths, error messages), where each duplicate sprite is an error
+    """
+    path = directoryPath(job, "input")
+    modPath = directoryPath(job, "modRoot")
+    targetPath = directoryPath(job, "output")
+    existingSprites = modSymbolLocations(modPath, "sprite") if job.get("checkExisting", False) else None
+
+    gfxFiles, duplicates = buildGFXFiles([path], modPath, targetPath, job.get("prefix", "GFX_"),
+                                         job.get("recursive", False), job.get("fileName"), job.get("sizes", False),
+                                         existingSprites)
+    return [targetPath + gfxFile for gfxFile in gfxFiles], \
+        [f"Duplicate sprite {duplicate['name']}: {', '.join(duplicate['texturefiles'])}" for duplicate in duplicates]
+
+
+def imageWriter(job: dict):
+    """
+    Creates the image writer of a job
+    :param job: Job dictionary with optionally "compressLevel" (PNG compression from 0 to 9), "optimize" and "mipmaps"
+    :return: ImageWriter
+    """
+    from ImageWriter import DEFAULT_COMPRESS_LEVEL, ImageWriter
+
+    return ImageWriter(compressLevel=job.get("compressLevel", DEFAULT_COMPRESS_LEVEL),
+                       optimize=job.get("optimize", False), mipmaps=job.get("mipmaps", False))
+
+
+def outputExtension(job: dict):
+    """
+    Gets the extension of the images a job writes
+    :param job: Job dictionary with optionally "format" (such as "png" or "dds")
+    :return: Extension starting with a dot, None to keep the extension of each input image
+    """
+    if "format" not in job:
+        return None
+    return "." + job["format"].lower().lstrip(".")
+
+
+def runPortraitsJob(job: dict):
+    """
+    Generates portraits (and optionally advisor portraits and focus icons) for a directory of images, decoding each
+    image once for all of its outputs
+    :param job: Job dictionary with "input", "output" and optionally "filter", "advisors", "workers", "incremental",
+    "compressLevel", "optimize", "format", "mipmaps", and "frame" with "focusOutput" (defaulting to "output") and "prefix" to also generate
+    focus icons
+    :return: Tuple of (output paths, error messages)
+    """
+    from PortraitCreator import generatePortraits
+
+    path = directoryPath(job, "input")
+    targetPath = directoryPath(job, "output")
+
+    focusFrames = None
+    if "frame" in job:
+        if not os.path.isfile(job["frame"]):
+            raise FileNotFoundError(f"frame does not exist: {job['frame']}")
+        iconPath = directoryPath(job, "focusOutput") if "focusOutput" in job else targetPath
+        focusFrames = [(job["frame"], iconPath, job.get("prefix", "GEN_"))]
+
+    images = listImageFiles(path, job.get("recursive", False))
+
+    with imageWriter(job) as writer:
+        results = generatePortraits(path, images, job.get("filter", False), targetPath, job.get("advisors", True),
+                                    workers=job.get("workers"), incremental=job.get("incremental", True),
+                                    focusFrames=focusFrames, extension=outputExtension(job), writer=writer)
+    print(writer.summary(), file=sys.stderr)
+    outputs = [outputPath for image, outputPaths, error in results for outputPath in outputPaths]
+    errors = [f"{image}: {error}" for image, outputPaths, error in results if error is not None]
+    return outputs, errors
+
+
+def runFocusIconsJob(job: dict):
+    """
+    Generates focus icons for a directory of images
+    :param job: Job dictionary with "input", "output", "frame" and optionally "prefix", "incremental", "compressLevel",
+    "optimize", "format" and "mipmaps"
+    :return: Tuple of (output paths, error messages)
+    """
+    from PortraitCreator import generateFocusIcons
+
+    path = directoryPath(job, "input")
+    targetPath = directoryPath(job, "output")
+    if not os.path.isfile(job.get("frame", "")):
+        raise FileNotFoundError("focusIcons jobs require an existing .pdn \"frame\"")
+
+    with imageWriter(job) as writer:
+        outputs = generateFocusIcons(path, listImageFiles(path, job.get("recursive", False)), job["frame"], targetPath,
+                                     job.get("prefix", "GEN_"), incremental=job.get("incremental", True),
+                                     writer=writer, extension=outputExtension(job))
+    print(writer.summary(), file=sys.stderr)
+    return outputs, []
+
+
+def runAtlasJob(job: dict):
+    """
+    Packs the same-size small images of a directory into strip sheets, with a GFX file of multi-frame sprites
+    :param job: Job dictionary with "input", "output" (within the mod), "modRoot", "gfxOutput" and optionally "name",
+    "prefix", "framesPerSheet", "format", "compressLevel", "optimize" and "mipmaps"
+    :return: Tuple of (output paths, error messages)
+    """
+    from SpriteAtlas import buildSpriteAtlas
+
+    path = directoryPath(job, "input")
+    targetPath = directoryPath(job, "output")
+    modPath = directoryPath(job, "modRoot")
+    gfxPath = directoryPath(job, "gfxOutput")
+    sheetName = job.get("name", "atlas")
+
+    with imageWriter(job) as writer:
+        sheets, skipped = buildSpriteAtlas(path, listImageFiles(path, job.get("recursive", False)), targetPath,
+                                           modPath, gfxPath, sheetName + ".gfx", job.get("prefix", "GFX_"), sheetName,
+                                           job.get("framesPerSheet", 64), outputExtension(job) or ".png", writer)
+    if len(skipped) > 0:
+        print(f"Left out of the atlas: {', '.join(skipped)}", file=sys.stderr)
+    return [targetPath + sheet.fileName for sheet in sheets] + [gfxPath + sheetName + ".gfx"], []
+
+
+def runGenericCharactersJob(job: dict):
+    """
+    Generates a generic character file for a directory of images
+    :param job: Job dictionary with "input", "output" and optionally "fileName", "prefix", "gfxPrefix" and
+    "charactersPerFile"
+    :return: Tuple of (output paths, error messages)
+    """
+    path = directoryPath(job, "input")
+    targetPath = directoryPath(job, "output")
+    targetFile = job.get("fileName", "custom_generic_characters.txt")
+
+    return generateGenericCharacters(listImageFiles(path, job.get("recursive", False)), targetPath, targetFile,
+                                     job.get("prefix", "GEN_"), job.get("gfxPrefix", "GFX_"),
+                                     job.get("charactersPerFile")), []
+
+
+def runLocalisationJob(job: dict):
+    """
+    Generates an english localisation file for a directory of images and text files
+    :param job: Job dictionary with "input", "output" and optionally "fileName", "ids", "images", "names", "merge" and
+    "checkExisting" with "modRoot" (leaving out keys already defined by other english localisation files of the mod,
+    found with the mod index)
+    :return: Tuple of (output paths, error messages)
+    """
+    path = directoryPath(job, "input")
+    targetPath = directoryPath(job, "output")
+    targetFile = job.get("fileName", os.path.basename(os.path.normpath(path)) + "_l_english.yml")
+
+    existingKeys = None
+    if job.get("checkExisting", False):
+        from ModChecker import localisationLanguage
+
+        modPath = directoryPath(job, "modRoot")
+        targetName = os.path.relpath(targetPath + targetFile, modPath).replace("\\", "/")
+        existingKeys = set(name for name, paths in modSymbolLocations(modPath, "localisation").items()
+                           if any(path != targetName and localisationLanguage(path) == "english" for path in paths))
+
+    keyCount, staleKeys = generateLocalisationFromFolder(path, targetPath, targetFile, job.get("ids", True),
+                                                         job.get("images", True), job.get("names", True),
+                                                         job.get("merge", False), job.get("recursive", False),
+                                                         existingKeys)
+    if len(staleKeys) > 0:
+        print(f"Stale localisation keys in {targetFile}: {', '.join(staleKeys)}", file=sys.stderr)
+    return [targetPath + targetFile] if os.path.exists(targetPath + targetFile) else [], []
+
+
+JOB_RUNNERS = {
+    "gfx": runGFXJob,
+    "portraits": runPortraitsJob,
+    "focusIcons": runFocusIconsJob,
+    "atlas": runAtlasJob,
+    "genericCharacters": runGenericCharactersJob,
+    "localisation": runLocalisationJob,
+}
+
+
+def runJobs(jobs: [dict]):
+    """
+    Runs every job of a manifest in order, a failing job does not stop the jobs after it
+    :param jobs: List of job dictionaries
+    :return: Summary dictionary of every job
+    """
+    summary = {"jobs": [], "succeeded": 0, "failed": 0}
+
+    for job in jobs:
+        startTime = time.perf_counter()
+        print(f"Running {job['type']} job for {job.get('input')}", file=sys.stderr)
+
+        try:
+            outputs, errors = JOB_RUNNERS[job["type"]](job)
+        except Exception:
+            outputs, errors = [], [traceback.format_exc()]
+
+        status = "failed" if len(errors) > 0 else "succeeded"
+        summary[status] += 1
+        summary["jobs"].append({
+            "type": job["type"],
+            "input": job.get("input"),
+            "status": status,
+            "outputs": outputs,
+            "errors": errors,
+            "seconds": round(time.perf_counter() - startTime, 3),
+        })
+
+    return summary
+
+
+def indexMod(modRoot: str, spritePrefix: str = "GFX_"):
+    """
+    Refreshes the symbol index of a mod and prints the number of files and symbols of each kind
+    :param modRoot: Path to the root of the mod
+    :param spritePrefix: Prefix of the sprite references to index, use the same prefix as check to reuse the index
+    :return: Exit code, 0 if the index was refreshed and 2 if the mod root does not exist
+    """
+    from ModIndex import ModIndex
+
+    if not os.path.isdir(modRoot):
+        print(json.dumps({"error": f"modRoot directory does not exist: {modRoot}"}))
+        return 2
+
+    startTime = time.perf_counter()
+    with ModIndex(os.path.join(modRoot, "").replace("\\", "/"), spritePrefix) as index:
+        indexed, removed = index.refresh()
+        summary = {
+            "indexed": indexed,
+            "removed": removed,
+            "files": len(index.filePaths()),
+            "symbols": {kind: count for kind, count in
+                        index.connection.execute("SELECT kind, COUNT(*) FROM symbols GROUP BY kind")},
+            "seconds": round(time.perf_counter() - startTime, 3),
+        }
+
+    print(json.dumps(summary, indent=4))
+    return 0
+
+
+def checkModRoot(modRoot: str, spritePrefix: str, workers: int, reportPath: str):
+    """
+    Checks a mod for missing and duplicate symbols and prints the JSON report
+    :param modRoot: Path to the root of the mod
+    :param spritePrefix: Prefix of the sprite references to check
+    :param workers: Number of worker processes, None uses every core
+    :param reportPath: Path to also write the report to, None to only print it
+    :return: Exit code, 0 if no problems were found, 1 if any were found and 2 if the mod root does not exist
+    """
+    from ModChecker import checkMod
+
+    if not os.path.isdir(modRoot):
+        print(json.dumps({"error": f"modRoot directory does not exist: {modRoot}"}))
+        return 2
+
+    startTime = time.perf_counter()
+    report = checkMod(os.path.join(modRoot, "").replace("\\", "/"), spritePrefix, workers)
+    report["seconds"] = round(time.perf_counter() - startTime, 3)
+
+    reportText = json.dumps(report, indent=4)
+    print(reportText)
+    if reportPath is not None:
+        with open(reportPath, "w", encoding="utf-8") as file:
+            file.write(reportText)
+
+    return 0 if report["problems"] == 0 else 1
+
+
+def addSharedFocusToTrees(inputDir: str, sharedFocus: str, recursive: bool, dryRun: bool):
+    """
+    Adds a shared focus to every focus tree of a directory, printing the diff of each edited file
+    :param inputDir: Directory of focus tree files
+    :param sharedFocus: Name of the shared focus
+    :param recursive: Whether to also edit the focus trees of every subfolder
+    :param dryRun: Whether to only print the diffs without changing any file
+    :return: Exit code, 0 if every file was edited or unchanged, 1 if any failed and 2 if the directory does not exist
+    """
+    from ParadoxUtils import addSharedFocusToEveryTree
+
+    if not os.path.isdir(inputDir):
+        print(f"Input directory does not exist: {inputDir}", file=sys.stderr)
+        return 2
+
+    results = addSharedFocusToEveryTree(os.path.join(inputDir, ""), sharedFocus, dryRun, recursive)
+    for filePath, status, diff in results:
+        if status == "edited":
+            sys.stdout.write(diff)
+        print(f"{status}: {filePath}" + (f"\n{diff}" if status == "failed" else ""), file=sys.stderr)
+
+    return 0 if all(status != "failed" for filePath, status, diff in results) else 1
+
+
+def main(args: [str] = None):
+    """
+    Command line entry point
+    :param args: Command line arguments, defaults to sys.argv
+    :return: Exit code, 0 if every job succeeded, 1 if any job failed and 2 if the manifest or mod root could not be
+    loaded
+    """
+    parser = argparse.ArgumentParser(description="Hearts of Iron 4 Utility Tool batch runner")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    runParser = subparsers.add_parser("run", help="Run every job within a JSON or TOML manifest")
+    runParser.add_argument("manifest", help="Path to the job manifest")
+    runParser.add_argument("--summary", help="Also write the JSON summary to this file")
+
+    indexParser = subparsers.add_parser("index", help="Build or refresh the symbol index of a mod")
+    indexParser.add_argument("modRoot", help="Path to the root of the mod")
+    indexParser.add_argument("--prefix", default="GFX_", help="Prefix of the sprite references to index")
+
+    checkParser = subparsers.add_parser("check", help="Check a mod for missing and duplicate sprites, textures, "
+                                                      "focuses and localisation")
+    checkParser.add_argument("modRoot", help="Path to the root of the mod")
+    checkParser.add_argument("--prefix", default="GFX_", help="Prefix of the sprite references to check")
+    checkParser.add_argument("--workers", type=int, help="Number of worker processes, defaults to every core")
+    checkParser.add_argument("--report", help="Also write the JSON report to this file")
+
+    sharedFocusParser = subparsers.add_parser("add-shared-focus", help="Add a shared focus to every focus tree")
+    sharedFocusParser.add_argument("input", help="Directory of focus tree files")
+    sharedFocusParser.add_argument("sharedFocus", help="Name of the shared focus")
+    sharedFocusParser.add_argument("--recursive", action="store_true", help="Also edit every subfolder")
+    sharedFocusParser.add_argument("--dry-run", action="store_true", help="Only print the diffs of every edit")
+
+    args = parser.parse_args(args)
+    if args.command == "index":
+        return indexMod(args.modRoot, args.prefix)
+    if args.command == "check":
+        return checkModRoot(args.modRoot, args.prefix, args.workers, args.report)
+    if args.command == "add-shared-focus":
+        return addSharedFocusToTrees(args.input, args.sharedFocus, args.recursive, args.dry_run)
+
+    summaryPath = os.path.abspath(args.summary) if args.summary is not None else None
+
+    try:
+        jobs = loadManifest(args.manifest)
+    except (OSError, ValueError, ManifestError) as e:
+        print(json.dumps({"error": str(e)}))
+        return 2
+
+    # Frame assets are referenced relative to the tool directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    summary = runJobs(jobs)
+
+    summaryText = json.dumps(summary, indent=4)
+    print(summaryText)
+    if summaryPath is not None:
+        with open(summaryPath, "w", encoding="utf-8") as file:
+            file.write(summaryText)
+
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
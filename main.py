@@ -1,4 +1,18 @@
+import time
+
+# Recorded before anything else is imported, so --profile-startup covers the full time to window
+STARTUP_TIME = time.perf_counter()
+
+import sys
+from StartupProfiler import importProfiler
+
+if "--profile-startup" in sys.argv:
+    importProfiler.install()
+
+import multiprocessing
 import os.path
+import queue
+import threading
 import traceback
 from tkinter import Event, StringVar, BooleanVar
 import ttkbootstrap as ttk
@@ -7,12 +21,102 @@ from ttkbootstrap.constants import *
 from tkinter.filedialog import askdirectory, askopenfilename
 from functools import partial
 from ttkbootstrap.toast import ToastNotification
-from PortraitCreator import *
+from ImageWriter import ImageWriter
 from ParadoxUtils import *
 
+# How often (in milliseconds) the Tk main loop checks for progress from running jobs
+JOB_POLL_INTERVAL = 100
+
+# Tabs that need PortraitCreator, which pulls in cv2, numpy, PIL and pypdn
+IMAGING_TABS = [1, 2]
+
+_portraitCreator = None
+_portraitCreatorLock = threading.Lock()
 
-# Create the root tkkbootstrap window
-root = ttk.Window(size=(800, 600), themename="darkly")
+
+def loadPortraitCreator():
+    """
+    Import PortraitCreator the first time a tab needs it, rather than when the tool starts
+    :return: The PortraitCreator module
+    """
+    global _portraitCreator
+    with _portraitCreatorLock:
+        if _portraitCreator is None:
+            startTime = time.perf_counter()
+            import PortraitCreator
+            _portraitCreator = PortraitCreator
+
+            if importProfiler.enabled:
+                print(f"Lazily imported PortraitCreator in {time.perf_counter() - startTime:.3f}s")
+    return _portraitCreator
+
+
+class JobCancelled(Exception):
+    """
+    Raised within a generation job when the user has cancelled it
+    """
+
+
+class GenerationJob:
+    def __init__(self, tabIndex: int, work, messages: queue.Queue):
+        """
+        Initialize a job that runs a generation function on a worker thread
+        :param tabIndex: The index of the tab that started the job
+        :param work: Callable taking a progress callback (items done, total items) and returning a summary message
+        :param messages: Thread-safe queue that progress and completion messages are posted to
+        """
+        self.tabIndex = tabIndex
+        self.work = work
+        self.messages = messages
+        self.cancelEvent = threading.Event()
+        self.startTime = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        """
+        Start running the job on its worker thread
+        """
+        self.startTime = time.perf_counter()
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Request the job to stop, the job stops the next time it reports progress
+        """
+        self.cancelEvent.set()
+
+    def isRunning(self):
+        """
+        Check if the job is still running
+        :return: True if the worker thread is alive, otherwise False
+        """
+        return self.thread.is_alive()
+
+    def run(self):
+        """
+        Run the job, posting a "finished", "cancelled" or "failed" message once it stops
+        """
+        try:
+            summary = self.work(self.reportProgress)
+            self.messages.put((self.tabIndex, "finished", summary))
+        except JobCancelled:
+            self.messages.put((self.tabIndex, "cancelled", None))
+        except Exception:
+            self.messages.put((self.tabIndex, "failed", traceback.format_exc()))
+
+    def reportProgress(self, done: int, total: int):
+        """
+        Post the progress of the job, raising JobCancelled if the job has been cancelled
+        :param done: Number of items completed
+        :param total: Total number of items in the job
+        """
+        if self.cancelEvent.is_set():
+            raise JobCancelled()
+
+        elapsed = time.perf_counter() - self.startTime
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else None
+        self.messages.put((self.tabIndex, "progress", (done, total, rate, eta)))
 
 
 class UtilityTool(ttk.Frame):
@@ -31,6 +135,7 @@ class UtilityTool(ttk.Frame):
 
         tabFrame = ttk.Notebook(master, bootstyle="info")
         tabFrame.pack(side=TOP, fill=BOTH, padx=10, pady=10)
+        tabFrame.bind("<<NotebookTabChanged>>", self.onTabChanged)
 
         self.tabNames = ["Generate GFX", "Generate Portraits", "Generate Focus Icon", "Generate Generic Characters",
                          "Generate Localisation"]
@@ -46,6 +151,7 @@ class UtilityTool(ttk.Frame):
         self.outputErrors = []
         self.filterDirectories = {}
         self.localisationDesiredIdentifiers = {}
+        self.includeSubfolders = [BooleanVar(value=False) for tabName in self.tabNames]
         self.referenceVars = {
             "modRoot": StringVar(value="No modroot set"),
             "0": StringVar(value="No output set"),
@@ -58,11 +164,28 @@ class UtilityTool(ttk.Frame):
         self.referenceVars["modRoot"].trace("w", self.updateModRoot)
         self.modRootError = ttk.Label()
         self.createAdvisors = BooleanVar(value=False)
+        self.portraitFocusIcons = BooleanVar(value=False)
+        self.incrementalPortraits = BooleanVar(value=True)
+        self.incrementalFocusIcons = BooleanVar(value=True)
+        self.ddsPortraits = BooleanVar(value=False)
+        self.ddsFocusIcons = BooleanVar(value=False)
+        self.mergeLocalisation = BooleanVar(value=False)
         self.focusIconPrefix = StringVar(value="GEN_")
         self.gfxPrefix = StringVar(value="GFX_")
+        self.mergeGFX = BooleanVar(value=False)
+        self.gfxMergedFileName = StringVar(value="generated_sprites.gfx")
+        self.gfxSizes = BooleanVar(value=False)
         self.characterPrefix = StringVar(value="GEN_")
         self.characterFileName = StringVar(value="custom_generic_characters.txt")
         self.characterGFXPrefix = StringVar(value="GFX_")
+        self.charactersPerFile = StringVar(value="0")
+
+        # Generation runs in background jobs which post their progress to jobMessages
+        self.jobs = {}
+        self.jobMessages = queue.Queue()
+        self.statusLabels = []
+        self.progressBars = []
+        self.cancelButtons = []
 
         for i in range(0, len(self.tabNames)):
             newTab = ttk.Frame(tabFrame)
@@ -72,8 +195,11 @@ class UtilityTool(ttk.Frame):
             buttonMessage = self.createOutputFrame(i)
             self.outputButtons.append(buttonMessage[0])
             self.outputErrors.append(buttonMessage[1])
+            self.createStatusFrame(i)
             self.referenceVars[str(i)].trace("w", partial(self.updateOutputDir, i))
 
+        self.after(JOB_POLL_INTERVAL, self.pollJobs)
+
     def createInputFrame(self, tabIndex):
         """
         Create the input frame for a specific tab
@@ -99,6 +225,8 @@ class UtilityTool(ttk.Frame):
                           ).pack(side=TOP, fill=X, expand=YES)
 
         self.createPathRow(inputFrame, tabIndex, "Add input directory")
+        ttk.Checkbutton(inputFrame, text="Include subfolders", bootstyle="square-toggle",
+                        variable=self.includeSubfolders[tabIndex]).pack(side=TOP, pady=5)
         sf = ScrolledFrame(inputFrame, autohide=True, height=100, bootstyle="primary")
         sf.pack(fill=BOTH, expand=YES, padx=10, pady=10)
 
@@ -132,11 +260,26 @@ class UtilityTool(ttk.Frame):
         match tabIndex:
             case 0:
                 UtilityTool.addPrefixEntry(outputFrame, "GFX ID Prefix", self.gfxPrefix)
+                UtilityTool.addPrefixEntry(outputFrame, "Merged File Name", self.gfxMergedFileName)
+                ttk.Checkbutton(outputFrame, text="Merge into one file", bootstyle="square-toggle",
+                                variable=self.mergeGFX).pack(side=RIGHT, pady=10, padx=10, fill=X)
+                ttk.Checkbutton(outputFrame, text="Record texture sizes", bootstyle="square-toggle",
+                                variable=self.gfxSizes).pack(side=RIGHT, pady=10, padx=10, fill=X)
             case 1:
                 ttk.Checkbutton(outputFrame, text="Generate advisor portraits", bootstyle="square-toggle",
                                 variable=self.createAdvisors).pack(side=RIGHT, pady=10, padx=10, fill=X)
+                ttk.Checkbutton(outputFrame, text="Generate focus icons", bootstyle="square-toggle",
+                                variable=self.portraitFocusIcons).pack(side=RIGHT, pady=10, padx=10, fill=X)
+                ttk.Checkbutton(outputFrame, text="Skip unchanged images", bootstyle="square-toggle",
+                                variable=self.incrementalPortraits).pack(side=RIGHT, pady=10, padx=10, fill=X)
+                ttk.Checkbutton(outputFrame, text="Write DDS textures", bootstyle="square-toggle",
+                                variable=self.ddsPortraits).pack(side=RIGHT, pady=10, padx=10, fill=X)
             case 2:
                 UtilityTool.addPrefixEntry(outputFrame, "Focus Image Prefix", self.focusIconPrefix)
+                ttk.Checkbutton(outputFrame, text="Skip unchanged images", bootstyle="square-toggle",
+                                variable=self.incrementalFocusIcons).pack(side=RIGHT, pady=10, padx=10, fill=X)
+                ttk.Checkbutton(outputFrame, text="Write DDS textures", bootstyle="square-toggle",
+                                variable=self.ddsFocusIcons).pack(side=RIGHT, pady=10, padx=10, fill=X)
             case 3:
                 newFrame = ttk.Frame(outputFrame)
                 newFrame.pack(side=TOP)
@@ -145,9 +288,35 @@ class UtilityTool(ttk.Frame):
                 newFrame2 = ttk.Frame(outputFrame)
                 newFrame2.pack(side=TOP)
                 UtilityTool.addPrefixEntry(newFrame2, "GFX ID Prefix", self.characterGFXPrefix)
+                UtilityTool.addPrefixEntry(newFrame2, "Characters Per File (0 for one file)", self.charactersPerFile)
+            case 4:
+                ttk.Checkbutton(outputFrame, text="Merge into existing files", bootstyle="square-toggle",
+                                variable=self.mergeLocalisation).pack(side=RIGHT, pady=10, padx=10, fill=X)
 
         return outputButton, errorMessage
 
+    def createStatusFrame(self, tabIndex):
+        """
+        Create the status frame, showing the progress of the running job, for a specific tab
+        :param tabIndex: The index of the tab for which to create the status frame
+        """
+        statusFrame = ttk.LabelFrame(self.tabs[tabIndex], text="Status", bootstyle="info", padding=10)
+        statusFrame.pack(side=TOP, pady=5, padx=10, fill=X)
+
+        cancelButton = ttk.Button(statusFrame, text="Cancel", bootstyle="danger", state=DISABLED,
+                                  command=partial(self.cancelJob, tabIndex))
+        cancelButton.pack(side=RIGHT, padx=10)
+
+        progressBar = ttk.Progressbar(statusFrame, bootstyle="success-striped", maximum=1)
+        progressBar.pack(side=BOTTOM, fill=X, expand=YES, padx=10, pady=(5, 0))
+
+        statusLabel = ttk.Label(statusFrame, text="Idle")
+        statusLabel.pack(side=LEFT, padx=10)
+
+        self.statusLabels.append(statusLabel)
+        self.progressBars.append(progressBar)
+        self.cancelButtons.append(cancelButton)
+
     def createPathRow(self, frame, tabIndex, label, key=None):
         """
         Add a path row to a label frame
@@ -222,6 +391,15 @@ class UtilityTool(ttk.Frame):
 
         self.inputDirs[tabIndex][directory] = currentFrame
 
+    def onTabChanged(self, event: Event):
+        """
+        Start importing the imaging modules in the background when a tab that needs them is first opened
+        :param event: The event object containing the notebook whose tab changed
+        """
+        notebook = event.widget
+        if notebook.index(notebook.select()) in IMAGING_TABS and _portraitCreator is None:
+            threading.Thread(target=loadPortraitCreator, daemon=True).start()
+
     def onEntryEnter(self, event: Event, tabIndex: int):
         """
         Handle the event when an entry widget receives an Enter key press
@@ -288,107 +466,238 @@ class UtilityTool(ttk.Frame):
         self.showErrorIfPathInvalid(self.referenceVars[str(realIndex)].get(), "Output Directory must be a valid path",
                                     self.outputErrors[realIndex])
 
-    def generateGFX(self):
+    def startJob(self, tabIndex, work):
         """
-        Generate GFX files based on input directories and user settings
-        :return: True if the GFX generation succeeds, otherwise False
+        Start a background generation job for a tab, unless the tab already has a job running
+        :param tabIndex: The index of the tab starting the job
+        :param work: Callable taking a progress callback (items done, total items) and returning a summary message
+        :return: True if the job was started, otherwise False
+        """
+        if tabIndex in self.jobs and self.jobs[tabIndex].isRunning():
+            UtilityTool.displayError(f"{self.tabNames[tabIndex]} is already running")
+            return False
+
+        job = GenerationJob(tabIndex, work, self.jobMessages)
+        self.jobs[tabIndex] = job
+        self.statusLabels[tabIndex].configure(text="Starting...", bootstyle="default")
+        self.progressBars[tabIndex].configure(value=0, maximum=1)
+        self.cancelButtons[tabIndex].configure(state=NORMAL)
+        job.start()
+        return True
+
+    def cancelJob(self, tabIndex):
+        """
+        Cancel the running job of a tab
+        :param tabIndex: The index of the tab whose job is cancelled
+        """
+        if tabIndex in self.jobs and self.jobs[tabIndex].isRunning():
+            self.jobs[tabIndex].cancel()
+            self.statusLabels[tabIndex].configure(text="Cancelling...")
+
+    def pollJobs(self):
+        """
+        Apply every message posted by running jobs to the status frames, then reschedule itself on the Tk main loop
         """
         try:
-            for path in self.inputDirs[0]:
-                path = self.addEndingSlash(path)
-                modPath = self.addEndingSlash(self.referenceVars["modRoot"].get())
-                targetPath = self.addEndingSlash(self.referenceVars["0"].get())
-                targetFile = self.replaceSlashes(path.replace(modPath, ""), "_")[:-1]
-
-                if not self.checkDirsExist([path, modPath, targetPath]):
-                    return False
-                else:
-                    generateGFXFile(path, modPath, targetPath,
-                                    targetFile + ".gfx", UtilityTool.listImageFiles(path), self.gfxPrefix.get())
-                    return True
-        except:
-            print("Generate GFX failed")
+            while True:
+                tabIndex, state, data = self.jobMessages.get_nowait()
+                statusLabel = self.statusLabels[tabIndex]
+
+                match state:
+                    case "progress":
+                        done, total, rate, eta = data
+                        self.progressBars[tabIndex].configure(value=done, maximum=max(total, 1))
+                        statusLabel.configure(text=f"{done}/{total} done ({rate:.1f} per second, "
+                                                   f"{UtilityTool.formatDuration(eta)} remaining)")
+                    case "finished":
+                        statusLabel.configure(text=data, bootstyle="success")
+                    case "cancelled":
+                        statusLabel.configure(text="Cancelled", bootstyle="warning")
+                    case "failed":
+                        print(data)
+                        statusLabel.configure(text="Failed, see the console for details", bootstyle="danger")
+
+                if state != "progress":
+                    self.cancelButtons[tabIndex].configure(state=DISABLED)
+        except queue.Empty:
+            pass
+
+        self.after(JOB_POLL_INTERVAL, self.pollJobs)
+
+    def generateGFX(self):
+        """
+        Generate GFX files based on input directories and user settings
+        :return: True if the GFX generation job was started, otherwise False
+        """
+        modPath = self.addEndingSlash(self.referenceVars["modRoot"].get())
+        targetPath = self.addEndingSlash(self.referenceVars["0"].get())
+        gfxPrefix = self.gfxPrefix.get()
+        recursive = self.includeSubfolders[0].get()
+        mergedFileName = self.replaceSlashes(self.gfxMergedFileName.get(), "_") if self.mergeGFX.get() else None
+        includeSizes = self.gfxSizes.get()
+        paths = [self.addEndingSlash(path) for path in self.inputDirs[0]]
+
+        if not self.checkDirsExist(paths + [modPath, targetPath]):
+            UtilityTool.displayError("Input, output and mod directories must be valid paths")
             return False
 
+        def work(progress):
+            gfxFiles, duplicates = buildGFXFiles(paths, modPath, targetPath, gfxPrefix, recursive, mergedFileName,
+                                                 includeSizes)
+            progress(1, 1)
+
+            for duplicate in duplicates:
+                print(f"Duplicate sprite {duplicate['name']}: {', '.join(duplicate['texturefiles'])}")
+            return f"Generated {len(gfxFiles)} GFX files" + \
+                (f", {len(duplicates)} duplicate sprites skipped" if len(duplicates) > 0 else "")
+
+        return self.startJob(0, work)
+
     def generatePortraits(self):
         """
         Generate portraits based on input directories and user settings
-        :return: True if the portrait generation succeeds, otherwise False
+        :return: True if the portrait generation job was started, otherwise False
         """
-        try:
-            for key in self.inputDirs[1]:
-                path = self.addEndingSlash(key)
-                targetPath = self.addEndingSlash(self.referenceVars["1"].get())
+        targetPath = self.addEndingSlash(self.referenceVars["1"].get())
+        createAdvisors = self.createAdvisors.get()
+        incremental = self.incrementalPortraits.get()
+        extension = ".dds" if self.ddsPortraits.get() else None
+        recursive = self.includeSubfolders[1].get()
+        inputs = [(self.addEndingSlash(key), self.filterDirectories[key].get()) for key in self.inputDirs[1]]
 
-                if not self.checkDirsExist([path, targetPath]):
-                    return False
-                else:
-                    generatePortraits(path, UtilityTool.listImageFiles(path), self.filterDirectories[key].get(),
-                                      targetPath,
-                                      self.createAdvisors.get())
-        except Exception as e:
-            print("Generate Portraits failed")
-            print(f"An error occurred: {e}")
-            traceback.print_exc()
+        if not self.checkDirsExist([path for path, filterImages in inputs] + [targetPath]):
+            UtilityTool.displayError("Input and output directories must be valid paths")
             return False
 
+        # Focus icons use the frame, output and prefix of the Focus Icon tab, generated from the same decode of each
+        # image as its portraits
+        focusFrames = None
+        if self.portraitFocusIcons.get():
+            focusFrame = self.referenceVars["focusFrame"].get()
+            focusTargetPath = self.addEndingSlash(self.referenceVars["2"].get())
+            if not os.path.isfile(focusFrame) or not self.checkDirsExist([focusTargetPath]):
+                UtilityTool.displayError("Set a focus frame and focus icon output directory in the Focus Icon tab")
+                return False
+            focusFrames = [(focusFrame, focusTargetPath, self.focusIconPrefix.get())]
+
+        def work(progress):
+            portraitCreator = loadPortraitCreator()
+            folders = [(path, listImageFiles(path, recursive), filterImages) for path, filterImages in inputs]
+            total = sum(len(images) for path, images, filterImages in folders)
+            done = 0
+            failed = 0
+
+            with ImageWriter() as writer:
+                for path, images, filterImages in folders:
+                    results = portraitCreator.generatePortraits(
+                        path, images, filterImages, targetPath, createAdvisors, workers=None,
+                        progress=lambda folderDone, folderTotal: progress(done + folderDone, total),
+                        incremental=incremental, focusFrames=focusFrames, extension=extension, writer=writer)
+                    done += len(images)
+                    for image, outputPaths, error in results:
+                        if error is not None:
+                            failed += 1
+                            print(f"Failed to generate portrait for {path + image}")
+                            print(error)
+            print(writer.summary())
+
+            # Images skipped by the incremental build are reported apart from those generated
+            skipped = writer.imagesSkipped
+            return f"Generated {done - failed - skipped} portraits" + \
+                (f", {skipped} up to date" if skipped > 0 else "") + (f", {failed} failed" if failed > 0 else "")
+
+        return self.startJob(1, work)
+
     def generateFocusIcon(self):
         """
         Generate focus icons based on input directories and user settings
-        :return: True if the focus icon generation succeeds, otherwise False
-        """
-        try:
-            for key in self.inputDirs[2]:
-                path = self.addEndingSlash(key)
-                targetPath = self.addEndingSlash(self.referenceVars["2"].get())
+        :return: True if the focus icon generation job was started, otherwise False
+        """
+        targetPath = self.addEndingSlash(self.referenceVars["2"].get())
+        focusFrame = self.referenceVars["focusFrame"].get()
+        focusIconPrefix = self.focusIconPrefix.get()
+        incremental = self.incrementalFocusIcons.get()
+        extension = ".dds" if self.ddsFocusIcons.get() else None
+        recursive = self.includeSubfolders[2].get()
+        paths = [self.addEndingSlash(key) for key in self.inputDirs[2]]
+
+        if not self.checkDirsExist(paths + [targetPath]):
+            UtilityTool.displayError("Input and output directories must be valid paths")
+            return False
 
-                if not self.checkDirsExist([path, targetPath]):
-                    return False
+        def work(progress):
+            portraitCreator = loadPortraitCreator()
+            folders = [(path, listImageFiles(path, recursive)) for path in paths]
+            total = sum(len(images) for path, images in folders)
+            done = 0
 
-                for image in UtilityTool.listImageFiles(path):
-                    icon = generateFocusIcon(Image.open(path + image), self.referenceVars["focusFrame"].get())
-                    icon.save(targetPath + self.focusIconPrefix.get() + image)
+            with ImageWriter() as writer:
+                for path, images in folders:
+                    portraitCreator.generateFocusIcons(
+                        path, images, focusFrame, targetPath, focusIconPrefix,
+                        lambda folderDone, folderTotal: progress(done + folderDone, total), incremental, writer,
+                        extension)
+                    done += len(images)
+            print(writer.summary())
 
-                return True
-        except:
-            print("Generate focus icon failed")
-            return False
+            skipped = writer.imagesSkipped
+            return f"Generated {done - skipped} focus icons" + (f", {skipped} up to date" if skipped > 0 else "")
+
+        return self.startJob(2, work)
 
     def generateGenericCharacters(self):
         """
         Generate generic characters based on input directories and user settings
-        :return: True if the generic character generation succeeds, otherwise False
+        :return: True if the generic character generation job was started, otherwise False
         """
-        try:
-            for key in self.inputDirs[3]:
-                path = self.addEndingSlash(key)
-                targetPath = self.addEndingSlash(self.referenceVars["3"].get())
-                targetFile = self.replaceSlashes(self.characterFileName.get(), "_")
+        targetPath = self.addEndingSlash(self.referenceVars["3"].get())
+        targetFile = self.replaceSlashes(self.characterFileName.get(), "_")
+        characterPrefix = self.characterPrefix.get()
+        characterGFXPrefix = self.characterGFXPrefix.get()
+        recursive = self.includeSubfolders[3].get()
+        paths = [self.addEndingSlash(key) for key in self.inputDirs[3]]
 
-                if not self.checkDirsExist([path, targetPath]):
-                    return False
+        if not self.checkDirsExist(paths + [targetPath]):
+            UtilityTool.displayError("Input and output directories must be valid paths")
+            return False
+        if not self.charactersPerFile.get().strip().isdigit():
+            UtilityTool.displayError("Characters per file must be a whole number")
+            return False
+        charactersPerFile = int(self.charactersPerFile.get()) or None
 
-                generateGenericCharacters(UtilityTool.listImageFiles(path), targetPath, targetFile)
+        def work(progress):
+            # Every input directory is streamed into the same character files
+            characters = (image for path in paths for image in listImageFiles(path, recursive))
+            characterFiles = generateGenericCharacters(characters, targetPath, targetFile, characterPrefix,
+                                                       characterGFXPrefix, charactersPerFile)
+            progress(1, 1)
+            return f"Generated {len(characterFiles)} character files"
 
-                return True
-        except:
-            print("Generate generic characters failed")
-            return False
+        return self.startJob(3, work)
 
     def generateLocalisation(self):
         """
         Generate localisation files based on input directories and user settings
-        :return: True if the localisation file generation succeeds, otherwise False
-        """
-        try:
-            localisationFileNames = {}
-            for key in self.inputDirs[4]:
-                path = self.addEndingSlash(key)
-                targetPath = self.addEndingSlash(self.referenceVars["4"].get())
-
-                if not self.checkDirsExist([path, targetPath]):
-                    return False
+        :return: True if the localisation generation job was started, otherwise False
+        """
+        targetPath = self.addEndingSlash(self.referenceVars["4"].get())
+        # Remember these are stored as [useID, useImages, useNames]
+        inputs = [(self.addEndingSlash(key), [useIdentifier.get() for useIdentifier in
+                                              self.localisationDesiredIdentifiers[key]])
+                  for key in self.inputDirs[4]]
+        merge = self.mergeLocalisation.get()
+        recursive = self.includeSubfolders[4].get()
+
+        if not self.checkDirsExist([path for path, useIdentifiers in inputs] + [targetPath]):
+            UtilityTool.displayError("Input and output directories must be valid paths")
+            return False
 
+        def work(progress):
+            localisationFileNames = {}
+            localisationFiles = []
+            totalKeys = 0
+            totalStaleKeys = 0
+            for path, useIdentifiers in inputs:
                 finalFolder = os.path.basename(os.path.normpath(path))
                 if finalFolder not in localisationFileNames:
                     localisationFileNames[finalFolder] = 1
@@ -396,27 +705,19 @@ class UtilityTool(ttk.Frame):
                     localisationFileNames[finalFolder] += 1
                     finalFolder += f"{localisationFileNames[finalFolder]}"
 
-                # Remember these are stored as [useID, useImages, useNames]
-                useIdentifiers = self.localisationDesiredIdentifiers[key]
-                if useIdentifiers[1].get():
-                    generateLocalisationFileFromStringList(UtilityTool.listImageFiles(path), targetPath,
-                                                           finalFolder + "_l_english.yml")
-
-                identifiers = []
-                identifiers.append("id") if useIdentifiers[0] else {}
-                identifiers.append("name") if useIdentifiers[2] else {}
-
-                if len(identifiers) > 0:
-                    for textFile in listTextFiles(path):
-                        with open(path + textFile, "r") as file:
-                            generateLocalisationFileFromIdentifiers(file.read(), targetPath,
-                                                                    finalFolder + "_l_english.yml", identifiers)
-                            file.close()
-
-                return True
-        except:
-            print("Generate localisation failed")
-            return False
+                keyCount, staleKeys = generateLocalisationFromFolder(path, targetPath, finalFolder + "_l_english.yml",
+                                                                     useIdentifiers[0], useIdentifiers[1],
+                                                                     useIdentifiers[2], merge, recursive)
+                totalKeys += keyCount
+                totalStaleKeys += len(staleKeys)
+                localisationFiles.append(finalFolder + "_l_english.yml")
+                progress(len(localisationFiles), len(inputs))
+
+            if merge:
+                return f"Added {totalKeys} keys to {len(localisationFiles)} files, {totalStaleKeys} stale keys"
+            return f"Generated {len(localisationFiles)} localisation files with {totalKeys} keys"
+
+        return self.startJob(4, work)
 
     @staticmethod
     def showErrorIfPathInvalid(path, text, label):
@@ -482,18 +783,16 @@ class UtilityTool(ttk.Frame):
         return True
 
     @staticmethod
-    def listImageFiles(directory):
+    def formatDuration(seconds):
         """
-        List image files in a specified directory
-        :param directory: The directory to search for image files
-        :return: A list of image file names in the directory
+        Format a duration in seconds as minutes and seconds
+        :param seconds: The duration to format, or None if it is unknown
+        :return: The duration as "m:ss", or "unknown time" if the duration is None
         """
-        # List all files in the directory
-        allFiles = os.listdir(directory)
-
-        # Filter for common image file extensions
-        imageFiles = [f for f in allFiles if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.dds'))]
-        return imageFiles
+        if seconds is None:
+            return "unknown time"
+        minutes, seconds = divmod(int(seconds), 60)
+        return f"{minutes}:{seconds:02d}"
 
     @staticmethod
     def displayError(message):
@@ -528,5 +827,16 @@ class UtilityTool(ttk.Frame):
 
 
 if __name__ == "__main__":
+    # Portraits are generated in a process pool, which needs this within the bundled executable
+    multiprocessing.freeze_support()
+
+    # Create the root tkkbootstrap window
+    root = ttk.Window(size=(800, 600), themename="darkly")
     UtilityTool(root)
+
+    if importProfiler.enabled:
+        root.update()
+        print(importProfiler.report(time.perf_counter() - STARTUP_TIME))
+        importProfiler.uninstall()
+
     root.mainloop()
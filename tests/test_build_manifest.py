@@ -0,0 +1,85 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from BuildManifest import BuildManifest
+from PortraitCreator import generatePortraits
+
+
+@pytest.fixture
+def inputDir(tmp_path, monkeypatch):
+    """
+    Creates an input folder holding a.png, with b.png in its sub folder
+    :return: Path of the input folder (ending with a slash)
+    """
+    # Frame assets are referenced relative to the tool directory
+    monkeypatch.chdir(REPO_DIR)
+    os.makedirs(tmp_path / "in" / "sub")
+    for i, name in enumerate(["in/a.png", "in/sub/b.png"]):
+        Image.fromarray(np.full((40, 30, 4), 60 * (i + 1), dtype=np.uint8)).save(tmp_path / name)
+    return str(tmp_path / "in") + "/"
+
+
+def outputFiles(outputDir: str):
+    return sorted(name for name in os.listdir(outputDir) if not name.startswith("."))
+
+
+def buildPortraits(sourceDir: str, images: [str], outputDir: str):
+    results = generatePortraits(sourceDir, images, False, outputDir, True, workers=1, incremental=True)
+    assert [error for image, outputPaths, error in results] == [None] * len(images)
+
+
+def test_nestedInputFoldersKeepEachOthersOutputs(inputDir, tmp_path):
+    outputDir = str(tmp_path / "out") + "/"
+
+    # Both folders are registered, the nested one is built first and the outer one without subfolders
+    for run in range(2):
+        buildPortraits(inputDir + "sub/", ["b.png"], outputDir)
+        buildPortraits(inputDir, ["a.png"], outputDir)
+        assert outputFiles(outputDir) == ["a.png", "b.png", "small_a.png", "small_b.png"]
+
+
+def test_recursiveBuildRemovesOutputsOfDeletedSubfolderImages(inputDir, tmp_path):
+    outputDir = str(tmp_path / "out") + "/"
+
+    buildPortraits(inputDir, ["a.png", "sub/b.png"], outputDir)
+    assert outputFiles(outputDir) == ["a.png", "small_a.png", "sub"]
+    assert sorted(os.listdir(outputDir + "sub")) == ["b.png", "small_b.png"]
+
+    os.remove(inputDir + "sub/b.png")
+    buildPortraits(inputDir, ["a.png"], outputDir)
+    assert os.listdir(outputDir + "sub") == []
+
+
+def test_removeOrphansFallsBackToSourceFolderForOldEntries(tmp_path):
+    outputDir = str(tmp_path) + "/"
+    sourceDir = str(tmp_path / "in")
+    manifest = BuildManifest(outputDir)
+    for name, source in [("a.png", "in/a.png"), ("b.png", "in/sub/b.png")]:
+        open(outputDir + name, "w").close()
+        manifest.outputs[name] = {"generator": "portraits", "source": str(tmp_path / source), "key": ""}
+
+    assert manifest.removeOrphans("portraits", sourceDir, []) == [outputDir + "a.png"]
+    assert list(manifest.outputs) == ["b.png"]
+
+
+def test_saveDropsHashesOfUnusedFiles(inputDir, tmp_path):
+    outputDir = str(tmp_path / "out") + "/"
+    buildPortraits(inputDir, ["a.png", "sub/b.png"], outputDir)
+
+    manifest = BuildManifest(outputDir)
+    assert os.path.abspath(inputDir + "sub/b.png") in manifest.fileHashes
+    os.remove(inputDir + "sub/b.png")
+    buildPortraits(inputDir, ["a.png"], outputDir)
+
+    fileHashes = BuildManifest(outputDir).fileHashes
+    assert os.path.abspath(inputDir + "a.png") in fileHashes
+    assert os.path.abspath(inputDir + "sub/b.png") not in fileHashes
+    # Frame assets are not the source of any output, but are kept while builds use them
+    assert os.path.abspath("Assets/Leader Background.png") in fileHashes
@@ -0,0 +1,152 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PortraitCreator import addMask, createMaskFromAlpha, createMaskFromBlack, invertMask
+
+
+# Reference implementations, the per-pixel loops the vectorised mask helpers replaced
+
+def referenceMaskFromAlpha(image: np.array):
+    mask = np.full((image.shape[0], image.shape[1]), 0, dtype=np.uint8)
+    for x in range(image.shape[0]):
+        for y in range(image.shape[1]):
+            try:
+                mask[x, y] = 255 - image[x, y, 3]
+            except IndexError:
+                mask[x, y] = 0
+    return mask
+
+
+def referenceMaskFromBlack(image: np.array):
+    mask = np.full((image.shape[0], image.shape[1]), 255, dtype=np.uint8)
+    for x in range(image.shape[0]):
+        for y in range(image.shape[1]):
+            if image[x, y].all() == 0:
+                mask[x, y] = 0
+    return mask
+
+
+def referenceAddMask(originalMask: np.array, newMask: np.array):
+    for x in range(originalMask.shape[0]):
+        for y in range(originalMask.shape[1]):
+            if newMask[x, y].all() == 0:
+                originalMask[x, y] = 0
+    return originalMask
+
+
+def referenceInvertMask(mask: np.array):
+    for x in range(mask.shape[0]):
+        for y in range(mask.shape[1]):
+            mask[x, y] = 255 - mask[x, y]
+    return mask
+
+
+def randomImage(shape: tuple, seed: int):
+    """
+    Creates a random uint8 image where roughly a quarter of the values are zero, so every mask has masked out pixels
+    :param shape: Shape of the image
+    :param seed: Seed of the random generator
+    :return: uint8 array
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 256, shape, dtype=np.uint8)
+    image[rng.random(shape) < 0.25] = 0
+    return image
+
+
+IMAGE_SHAPES = {
+    "RGBA": (13, 17, 4),
+    "RGB": (13, 17, 3),
+    "greyscale": (13, 17),
+}
+
+
+@pytest.mark.parametrize("mode", IMAGE_SHAPES)
+def test_createMaskFromAlpha(mode):
+    image = randomImage(IMAGE_SHAPES[mode], 1)
+    assert np.array_equal(createMaskFromAlpha(image), referenceMaskFromAlpha(image))
+
+
+@pytest.mark.parametrize("mode", IMAGE_SHAPES)
+def test_createMaskFromAlphaOut(mode):
+    image = randomImage(IMAGE_SHAPES[mode], 2)
+    out = np.full(image.shape[:2], 7, dtype=np.uint8)
+    result = createMaskFromAlpha(image, out=out)
+    assert result is out
+    assert np.array_equal(out, referenceMaskFromAlpha(image))
+
+
+@pytest.mark.parametrize("mode", IMAGE_SHAPES)
+def test_createMaskFromBlack(mode):
+    image = randomImage(IMAGE_SHAPES[mode], 3)
+    assert np.array_equal(createMaskFromBlack(image), referenceMaskFromBlack(image))
+
+
+@pytest.mark.parametrize("mode", IMAGE_SHAPES)
+def test_createMaskFromBlackOut(mode):
+    image = randomImage(IMAGE_SHAPES[mode], 4)
+    out = np.full(image.shape[:2], 7, dtype=np.uint8)
+    result = createMaskFromBlack(image, out=out)
+    assert result is out
+    assert np.array_equal(out, referenceMaskFromBlack(image))
+
+
+@pytest.mark.parametrize("mode", IMAGE_SHAPES)
+def test_addMaskInPlace(mode):
+    originalMask = randomImage((13, 17), 5)
+    newMask = randomImage(IMAGE_SHAPES[mode], 6)
+    expected = referenceAddMask(originalMask.copy(), newMask)
+
+    result = addMask(originalMask, newMask)
+    assert result is originalMask
+    assert np.array_equal(originalMask, expected)
+
+
+@pytest.mark.parametrize("mode", IMAGE_SHAPES)
+def test_addMaskOut(mode):
+    originalMask = randomImage((13, 17), 7)
+    newMask = randomImage(IMAGE_SHAPES[mode], 8)
+    unchanged = originalMask.copy()
+    expected = referenceAddMask(originalMask.copy(), newMask)
+
+    out = np.full((13, 17), 7, dtype=np.uint8)
+    result = addMask(originalMask, newMask, out=out)
+    assert result is out
+    assert np.array_equal(out, expected)
+    assert np.array_equal(originalMask, unchanged)
+
+
+def test_addMaskOutIsNewMask():
+    originalMask = randomImage((13, 17), 9)
+    newMask = randomImage((13, 17), 10)
+    expected = referenceAddMask(originalMask.copy(), newMask)
+
+    result = addMask(originalMask, newMask, out=newMask)
+    assert result is newMask
+    assert np.array_equal(newMask, expected)
+
+
+def test_invertMaskInPlace():
+    mask = randomImage((13, 17), 11)
+    expected = referenceInvertMask(mask.copy())
+
+    result = invertMask(mask)
+    assert result is mask
+    assert np.array_equal(mask, expected)
+
+
+def test_invertMaskOut():
+    mask = randomImage((13, 17), 12)
+    unchanged = mask.copy()
+    expected = referenceInvertMask(mask.copy())
+
+    out = np.empty((13, 17), dtype=np.uint8)
+    result = invertMask(mask, out=out)
+    assert result is out
+    assert np.array_equal(out, expected)
+    assert np.array_equal(mask, unchanged)
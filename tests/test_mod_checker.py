@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ModChecker import checkMod
+
+
+@pytest.fixture
+def modRoot(tmp_path):
+    """
+    Creates a mod defining MYMOD_defined and GFX_defined, whose focus tree references both along with
+    MYMOD_missing and GFX_missing
+    :return: Path of the mod root (ending with a slash)
+    """
+    os.makedirs(tmp_path / "interface")
+    os.makedirs(tmp_path / "common" / "national_focus")
+    (tmp_path / "interface" / "sprites.gfx").write_text(
+        "spriteTypes = {\n"
+        "    spriteType = { name = MYMOD_defined texturefile = gfx/a.dds }\n"
+        "    spriteType = { name = GFX_defined texturefile = gfx/a.dds }\n"
+        "}\n", encoding="utf-8")
+    (tmp_path / "common" / "national_focus" / "tree.txt").write_text(
+        "focus_tree = {\n"
+        "    id = tree\n"
+        "    focus = { id = first icon = MYMOD_defined }\n"
+        "    focus = { id = second icon = MYMOD_missing }\n"
+        "    focus = { id = third icon = GFX_defined }\n"
+        "    focus = { id = fourth icon = GFX_missing }\n"
+        "}\n", encoding="utf-8")
+    return str(tmp_path) + "/"
+
+
+def missingSprites(report: dict):
+    return [item["name"] for item in report["missing"]["sprites"]]
+
+
+def test_checkModWithCustomSpritePrefix(modRoot):
+    assert missingSprites(checkMod(modRoot, "MYMOD_", workers=1)) == ["MYMOD_missing"]
+
+
+def test_checkModRebuildsIndexWhenPrefixChanges(modRoot):
+    assert missingSprites(checkMod(modRoot, workers=1)) == ["GFX_missing"]
+    assert missingSprites(checkMod(modRoot, "MYMOD_", workers=1)) == ["MYMOD_missing"]
+    assert missingSprites(checkMod(modRoot, workers=1)) == ["GFX_missing"]